@@ -8,9 +8,43 @@ Created on Sun Apr 19 2020
 
 
 from abc import ABC, abstractmethod
-import matplotlib.pyplot as plt
+import pandas as pd
+import io
+import os
 
-from visualization.passing_network import draw_pitch, draw_pass_map
+from processing.cache import build_params
+
+
+def create_builder(args):
+    '''
+    Instantiates a Passing Network Builder depending on the data source and type of plot selected in the arguments.
+
+    Builders are imported inside each branch so that a run only loads the modules (and heavy
+    dependencies such as socceraction or matplotlib) that its source and plot type need.
+    '''
+    if args.source == "eventing":
+        if args.plot_type == "pass_value":
+            from processing.eventing import StatsBombValuePassingNetwork
+            return StatsBombValuePassingNetwork(args)
+        elif args.plot_type == "zones":
+            from processing.eventing import StatsBombZonePassingNetwork
+            return StatsBombZonePassingNetwork(args)
+        else:
+            from processing.eventing import StatsBombBasicPassingNetwork
+            return StatsBombBasicPassingNetwork(args)
+    else:
+        if args.plot_type == "tracking":
+            from processing.tracking import MetricaTrackingPassingNetwork
+            return MetricaTrackingPassingNetwork(args)
+        elif args.plot_type == "pass_time":
+            from processing.tracking import MetricaPassTimePassingNetwork
+            return MetricaPassTimePassingNetwork(args)
+        elif args.plot_type == "zones":
+            from processing.tracking import MetricaZonePassingNetwork
+            return MetricaZonePassingNetwork(args)
+        else:
+            from processing.tracking import MetricaBasicPassingNetwork
+            return MetricaBasicPassingNetwork(args)
 
 
 class PassingNetworkBuilder(ABC):
@@ -21,17 +55,201 @@ class PassingNetworkBuilder(ABC):
     Concrete subclasses should implement these operations for specific data
     sources (e.g. eventing vs tracking).
     """
+    def __init__(self, args):
+        self.render = not getattr(args, "no_render", False)
+        self.style = getattr(args, "style", None)
+        self.segments = getattr(args, "segments", False)
+        self.both_teams = getattr(args, "both_teams", False)
+        self.zones = None
+        self.bootstrap = getattr(args, "bootstrap", None)
+        self.bootstrap_alpha = getattr(args, "bootstrap_alpha", False)
+        self.similarity_index = getattr(args, "similarity_index", None)
+        self.use_cache = not getattr(args, "no_cache", False) and not self.similarity_index
+        self.params = build_params(args)
+        self.plot_type = args.plot_type
+        self.team_name = args.team_name
+        self.match_id = args.match_id
+
+        self.plot_name = None
+        self.outputs = None
+        self.images = None
+        self.build_cache = None
+        self.build_record = None
+        self.plot_title = None
+        self.plot_legend = None
+        self.timeline = None
+        self.start_minute = 0
+        self.num_minutes = None
+        self.networks = None
+        self.df_passes = None
+        self.player_intervals = None
+        self.pair_intervals = None
+        self.pair_alpha = None
+        self.player_position = None
+        self.pair_pass_value = None
+        self.pair_pass_count = None
+        self.player_pass_value = None
+        self.player_pass_count = None
+
     def build_and_save(self):
         """
         Template of the algorithm.
+
+        Unless the cache is disabled, plots whose data, parameters, configuration and code have not changed since
+        they were last built (see 'BuildCache') are not built again. Every plot built is recorded in the manifest.
+        Plots whose networks are added to a similarity index are always built, as the index needs them.
+
+        Returns
+        -----------
+           outputs: list of paths of the images of the plot.
         """
+        outputs = self.cached_outputs()
+        if outputs is not None:
+            print("{0} up to date".format(self.plot_name))
+            return outputs
+
         self.read_data()
-        self.compute_total_minutes()
-        self.set_text_info()
-        self.prepare_data()
-        self.build_plot()
+        self.build()
+        self.record_build()
 
         print("{0} done!".format(self.plot_name))
+        return self.outputs
+
+    def build(self):
+        """
+        Build the passing network (or networks) from the data already read, plotting it if requested.
+        """
+        self.outputs = []
+        if self.both_teams:
+            self.build_teams()
+        else:
+            self.compute_total_minutes()
+            self.set_text_info()
+
+            if self.segments:
+                self.build_segments()
+            else:
+                self.prepare_data()
+
+                if self.bootstrap:
+                    self.compute_intervals()
+
+                if self.render:
+                    self.build_plot()
+
+    def cached_outputs(self):
+        """
+        Outputs of a previous build of this plot from the same inputs, or None if it has to be built.
+        Only rendered plots are cached.
+        """
+        self.build_cache = None
+        if not self.render:
+            return None
+
+        from processing.cache import BuildCache, code_files
+        from visualization.style import DEFAULT_STYLE_PATH
+
+        cache = BuildCache()
+        builder_name = type(self).__name__
+        identity = cache.identity(builder_name, self.params)
+        inputs = cache.inputs(self.input_files() + code_files() + [self.style or DEFAULT_STYLE_PATH])
+        key = cache.key(identity, inputs)
+
+        entry = cache.lookup(identity, key) if self.use_cache else None
+        if entry is not None:
+            self.plot_name = entry["plot_name"]
+            return entry["outputs"]
+
+        self.build_cache = cache
+        self.build_record = {"identity": identity, "key": key, "builder_name": builder_name, "params": self.params,
+                             "inputs": inputs, "reason": cache.reason(identity, inputs)}
+        return None
+
+    def record_build(self):
+        """
+        Record the plot just built in the cache's manifest.
+        """
+        if self.build_cache is not None:
+            self.build_cache.record(plot_name=self.plot_name, outputs=self.outputs, **self.build_record)
+
+    def build_segments(self):
+        """
+        Build one passing network for each segment of the match with a stable lineup (see 'LineupTimeline.segments'),
+        reusing the data already read, instead of stopping at the first substitution or red card.
+        """
+        plot_name = self.plot_name
+        self.networks = []
+        for self.start_minute, self.num_minutes in self.timeline.segments():
+            self.plot_name = plot_name
+            self.prepare_data()
+
+            segment_title = "{0:.0f}' - {1:.0f}'".format(self.start_minute, self.num_minutes)
+            self.networks.append((self.player_position, self.player_pass_count, self.player_pass_value,
+                                  self.pair_pass_count, self.pair_pass_value, segment_title))
+
+        self.plot_name = "{0}_segments".format(self.plot_name)
+        if self.render:
+            self.build_multiples_plot()
+
+    def build_teams(self):
+        """
+        Build the passing networks of both teams of the match from the data read once, instead of running
+        a builder per team. They are plotted side by side with the same size and color scales.
+        """
+        teams = self.match_teams()
+        self.networks = []
+        for team_name in teams:
+            self.select_team(team_name)
+            self.compute_total_minutes()
+            self.set_text_info()
+            self.prepare_data()
+
+            self.networks.append((self.player_position, self.player_pass_count, self.player_pass_value,
+                                  self.pair_pass_count, self.pair_pass_value, team_name))
+
+        # Name of the last team's plot, with both teams instead
+        self.plot_name = self.plot_name.replace("_{0}_".format(teams[-1]), "_{0}_".format("_".join(teams)), 1)
+        self.plot_title = "{0} passing networks ({1})".format(" vs ".join(teams), self.source_name)
+        if self.render:
+            self.build_multiples_plot()
+
+    def plot_name_suffix(self):
+        """
+        Suffix of the plot's name for the arguments that change its image but not the network plotted (e.g. the
+        style), so that plots built with different values do not overwrite each other's files. Default values
+        add nothing.
+        """
+        from visualization.style import DEFAULT_STYLE_PATH
+        from processing.zones import DEFAULT_SHAPE
+
+        suffix = ""
+        if self.style and os.path.abspath(self.style) != os.path.abspath(DEFAULT_STYLE_PATH):
+            # 'visualization/plot_config_dark.json' is the 'dark' style
+            style_name = os.path.splitext(os.path.basename(self.style))[0]
+            suffix += "_{0}".format(style_name[len("plot_config_"):] if style_name.startswith("plot_config_") else style_name)
+        if self.zones is not None and tuple(self.zones) != DEFAULT_SHAPE:
+            suffix += "_{0}x{1}".format(*self.zones)
+        if self.bootstrap_alpha:
+            suffix += "_alpha"
+        return suffix
+
+    def select_team(self, team_name):
+        """
+        Make 'team_name' the team whose passing network is built next.
+        """
+        self.team_name = team_name
+
+    @abstractmethod
+    def match_teams(self):
+        pass
+
+    @abstractmethod
+    def input_files(self):
+        pass
+
+    @abstractmethod
+    def attacks_right(self, team_name=None):
+        pass
 
     @abstractmethod
     def read_data(self):
@@ -49,12 +267,104 @@ class PassingNetworkBuilder(ABC):
     def prepare_data(self):
         pass
 
+    def _pass_positions(self, df_passes, recipient_column):
+        """
+        Median pass origin ('origin_pos_x', 'origin_pos_y') of each passer in 'df_passes'. Players who only received
+        passes (e.g. in a short lineup segment) are placed at the median end of those passes ('end_pos_x',
+        'end_pos_y') instead, so that every player of a 'pair_key' has a position.
+        """
+        player_position = df_passes.groupby(self.passer_column).agg({"origin_pos_x": "median", "origin_pos_y": "median"})
+
+        receptions = df_passes[~df_passes[recipient_column].isin(player_position.index)]
+        receiver_position = receptions.groupby(recipient_column).agg(origin_pos_x=("end_pos_x", "median"),
+                                                                     origin_pos_y=("end_pos_y", "median"))
+        return pd.concat([player_position, receiver_position.rename_axis(self.passer_column)])
+
+    def compute_intervals(self):
+        """
+        Bootstrap confidence intervals of the network's weights from the passes in 'df_passes' (see 'bootstrap_network'),
+        exporting them into CSV files in the 'plots' folder. If requested, edges are drawn more transparent the
+        less certain their number of passes is.
+        """
+        from processing.bootstrap import bootstrap_network, interval_alpha
+
+        self.player_intervals, self.pair_intervals = bootstrap_network(self.df_passes, self.passer_column, self.value_column,
+                                                                       self.positions_from_passes, num_samples=self.bootstrap)
+        if self.bootstrap_alpha:
+            pair_pass_count = self.pair_pass_count.num_passes
+            self.pair_alpha = pd.Series(interval_alpha(pair_pass_count, self.pair_intervals.num_passes_low.reindex(pair_pass_count.index)),
+                                        index=pair_pass_count.index)
+
+        self.save_table(self.player_intervals, "players_intervals")
+        self.save_table(self.pair_intervals, "pairs_intervals")
+
     def build_plot(self):
         """
         Plot the pitch and passing network, saving the output image into the 'plots' folder.
         """
-        ax = draw_pitch()
+        # Matplotlib is only loaded when a plot is actually rendered
+        from visualization.passing_network import draw_pitch, draw_pass_map
+        from visualization.style import load_style
+
+        style = load_style(self.style)
+        ax = draw_pitch(zones=self.zones, style=style)
         draw_pass_map(ax, self.player_position, self.player_pass_count, self.player_pass_value,
-                      self.pair_pass_count, self.pair_pass_value, self.plot_title, self.plot_legend)
+                      self.pair_pass_count, self.pair_pass_value, self.plot_title, self.plot_legend,
+                      pair_alpha=self.pair_alpha, style=style)
+
+        self.save_plot()
+
+    def build_multiples_plot(self):
+        """
+        Plot the passing networks in 'networks' (e.g. one per lineup segment or per team) as small multiples
+        sharing the same size and color scales, saving the output image into the 'plots' folder.
+        """
+        import matplotlib.pyplot as plt
+        from visualization.passing_network import draw_pitches, draw_pass_map
+        from visualization.style import load_style
+
+        style = load_style(self.style)
+
+        max_player_count = max(network[1].num_passes.max() for network in self.networks)
+        max_player_value = max(network[2].pass_value.max() for network in self.networks)
+        max_pair_count = max(network[3].num_passes.max() for network in self.networks)
+        max_pair_value = max(network[4].pass_value.max() for network in self.networks)
+
+        axes = draw_pitches(len(self.networks), zones=self.zones, style=style)
+        for i, (ax, network) in enumerate(zip(axes, self.networks)):
+            legend = self.plot_legend if i == 0 else ""
+            draw_pass_map(ax, *network, legend=legend, max_player_count=max_player_count, max_player_value=max_player_value,
+                          max_pair_count=max_pair_count, max_pair_value=max_pair_value, style=style)
+
+        plt.suptitle(self.plot_title)
+        self.save_plot()
+
+    def save_table(self, table, name):
+        """
+        Save a pandas DataFrame computed along the network into a CSV file in the 'plots' folder, named after the
+        plot and 'name'. As with images (see 'save_plot'), when 'images' is a list the file is appended to it instead.
+        """
+        output = "plots/{0}_{1}.csv".format(self.plot_name, name)
+        if self.images is None:
+            table.to_csv(output)
+        else:
+            self.images.append((output, table.to_csv().encode("utf-8")))
+        self.outputs.append(output)
+
+    def save_plot(self):
+        """
+        Save the current figure into the 'plots' folder, named after the plot. When 'images' is a list, the PNG
+        is rendered in memory and appended to it with its path instead, so that someone else writes it.
+        """
+        import matplotlib.pyplot as plt
+
+        output = "plots/{0}.png".format(self.plot_name)
+        if self.images is None:
+            plt.savefig(output)
+        else:
+            image = io.BytesIO()
+            plt.savefig(image, format="png")
+            self.images.append((output, image.getvalue()))
 
-        plt.savefig("plots/{0}.png".format(self.plot_name))
+        plt.close()
+        self.outputs.append(output)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 19 2020
+
+@author: Sergio Llana (@SergioMinuto90)
+"""
+
+
+import pandas as pd
+import numpy as np
+
+
+def _group_sums(samples, codes, num_groups, weights=None):
+    '''
+    Sum of 'weights' (or number of passes if not given) of each group in each resample, as a (resamples, groups) array.
+    '''
+    keys = (np.arange(len(samples))[:, np.newaxis] * num_groups + codes[samples]).ravel()
+    weights = None if weights is None else weights[samples].ravel()
+    return np.bincount(keys, weights=weights, minlength=len(samples) * num_groups).reshape(len(samples), num_groups)
+
+
+def _group_medians(samples, codes, num_groups, values):
+    '''
+    Median of the values of each group in each resample, as a (resamples, groups) array (NaN for empty groups).
+    All groups of all resamples are sorted at once, and their medians picked by position.
+    '''
+    keys = (np.arange(len(samples))[:, np.newaxis] * num_groups + codes[samples]).ravel()
+    if not len(keys):
+        return np.full((len(samples), num_groups), np.nan)
+
+    sorted_values = values[samples].ravel()[np.lexsort((values[samples].ravel(), keys))]
+
+    counts = np.bincount(keys, minlength=len(samples) * num_groups)
+    starts = np.cumsum(counts) - counts
+    low = np.minimum(starts + (counts - 1) // 2, len(sorted_values) - 1)
+    high = np.minimum(starts + counts // 2, len(sorted_values) - 1)
+
+    medians = np.where(counts > 0, (sorted_values[low] + sorted_values[high]) / 2, np.nan)
+    return medians.reshape(len(samples), num_groups)
+
+
+def _mean_values(samples, codes, num_groups, values):
+    '''
+    Mean of the values of each group in each resample, leaving out NaN values (NaN if a group has none).
+    '''
+    valid = ~np.isnan(values)
+    sums = _group_sums(samples, codes, num_groups, np.where(valid, values, 0))
+    counts = _group_sums(samples, codes, num_groups, valid.astype(float))
+    return np.divide(sums, counts, out=np.full(sums.shape, np.nan), where=counts > 0)
+
+
+def _intervals(resampled, names, column, quantiles):
+    '''
+    DataFrame with the '<column>_low' and '<column>_high' quantiles of each group over the resamples.
+    '''
+    low, high = np.nanquantile(resampled, quantiles, axis=0) if len(names) else np.empty((2, 0))
+    return pd.DataFrame({"{0}_low".format(column): low, "{0}_high".format(column): high}, index=names)
+
+
+def bootstrap_network(df_passes, passer_column, value_column=None, positions=False, num_samples=1000, confidence=0.9,
+                      seed=None):
+    """
+    Confidence intervals of the weights of a passing network, resampling its passes (with replacement) 'num_samples'
+    times. Every resample is drawn at once as a (num_samples, passes) index matrix, and the statistics of all of them
+    are computed with batched NumPy operations instead of preparing the network again for each one.
+
+    Parameters
+    -----------
+        df_passes: pandas DataFrame with a pass per row, the passer in 'passer_column' and the 'pair_key' of the pass.
+        passer_column: name of the column with the passer of each pass.
+        value_column: name of the column with the value of each pass (e.g. VAEP), whose means per player and pair
+                      are bootstrapped too. If not specified, the value of the network is the number of passes.
+        positions: whether players are located at the median of their pass origins ('origin_pos_x', 'origin_pos_y'),
+                   so that the intervals of their positions are computed too.
+        num_samples: number of resamples.
+        confidence: probability covered by the intervals.
+        seed: seed of the random number generator, to make the intervals reproducible.
+
+    Returns
+    -----------
+       player_intervals: pandas DataFrame indexed by player with the low and high ends of 'num_passes',
+                         'pass_value' and, if requested, 'origin_pos_x' and 'origin_pos_y'.
+       pair_intervals: pandas DataFrame indexed by 'pair_key' with the low and high ends of 'num_passes' and 'pass_value'.
+    """
+    rng = np.random.default_rng(seed)
+    samples = rng.integers(0, max(len(df_passes), 1), size=(num_samples, len(df_passes)))
+    quantiles = [(1 - confidence) / 2, 1 - (1 - confidence) / 2]
+
+    players, player_codes = np.unique(df_passes[passer_column].to_numpy(dtype=str), return_inverse=True)
+    pairs, pair_codes = np.unique(df_passes["pair_key"].to_numpy(dtype=str), return_inverse=True)
+
+    player_counts = _group_sums(samples, player_codes, len(players))
+    pair_counts = _group_sums(samples, pair_codes, len(pairs))
+
+    player_intervals = [_intervals(player_counts, players, "num_passes", quantiles)]
+    pair_intervals = [_intervals(pair_counts, pairs, "num_passes", quantiles)]
+
+    if value_column is None:
+        player_intervals.append(_intervals(player_counts, players, "pass_value", quantiles))
+        pair_intervals.append(_intervals(pair_counts, pairs, "pass_value", quantiles))
+    else:
+        values = df_passes[value_column].to_numpy(dtype=float)
+        player_intervals.append(_intervals(_mean_values(samples, player_codes, len(players), values), players, "pass_value", quantiles))
+        pair_intervals.append(_intervals(_mean_values(samples, pair_codes, len(pairs), values), pairs, "pass_value", quantiles))
+
+    if positions:
+        for column in ["origin_pos_x", "origin_pos_y"]:
+            medians = _group_medians(samples, player_codes, len(players), df_passes[column].to_numpy(dtype=float))
+            player_intervals.append(_intervals(medians, players, column, quantiles))
+
+    return pd.concat(player_intervals, axis=1), pd.concat(pair_intervals, axis=1)
+
+
+def interval_alpha(estimates, lows, min_alpha=0.15):
+    '''
+    Transparency of each weight from its confidence interval: opaque when the low end of the interval is close to
+    the estimate, and down to 'min_alpha' when it is close to zero (i.e. the weight could just be noise).
+    '''
+    estimates, lows = np.asarray(estimates, dtype=float), np.asarray(lows, dtype=float)
+    ratios = np.divide(lows, estimates, out=np.zeros_like(estimates), where=estimates > 0)
+    return min_alpha + (1 - min_alpha) * np.clip(np.nan_to_num(ratios), 0, 1)
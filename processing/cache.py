@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 19 2020
+
+@author: Sergio Llana (@SergioMinuto90)
+"""
+
+
+from datetime import datetime
+import hashlib
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: builds recorded at the same time by several processes may overwrite each other
+    fcntl = None
+
+
+DEFAULT_MANIFEST_PATH = "plots/manifest.json"
+
+# Code that builds the plots: every module of these packages is hashed, as builders import some of them lazily
+CODE_PACKAGES = ["processing", "visualization"]
+CODE_MODULES = ["utils.py"]
+
+
+def file_digest(path, chunk_size=1 << 20):
+    '''
+    SHA-256 of the contents of a file, read in chunks.
+    '''
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_params(args):
+    '''
+    Parameters of a build that identify it in the cache: the command line arguments, leaving out the ones
+    that do not change the plot (e.g. a match store, the cache itself or the similarity index).
+    '''
+    return {name: value for name, value in sorted(vars(args).items()) if name not in ["store", "no_cache", "similarity_index"]}
+
+
+def code_files():
+    '''
+    Source files of every module that can take part in a build, relative to the repository's root.
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    files = [os.path.join(root, module) for module in CODE_MODULES]
+    for package in CODE_PACKAGES:
+        for folder, _, names in os.walk(os.path.join(root, package)):
+            files += [os.path.join(folder, name) for name in names if name.endswith(".py")]
+    return sorted(os.path.relpath(f) for f in files)
+
+
+class BuildCache(object):
+    """
+    Content-addressed cache of the plots built by 'PassingNetworkBuilder.build_and_save', backed by a JSON manifest.
+
+    A build is identified by its builder class and parameters (command line arguments), and its key is the hash of
+    that identity plus the contents of its input files (data, plot configuration and code). When the manifest holds
+    the same key for a build and its outputs are still the files it wrote, the build can be skipped. Every build
+    records in the manifest its inputs, the digests of its outputs and why it was (re)built.
+
+    File digests are remembered in the manifest together with each file's size and modification time, so large
+    data files are only hashed again when they change.
+    """
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self.manifest = self._read()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {"builds": {}, "files": {}}
+
+        with open(self.path) as f:
+            return json.load(f)
+
+    def digest(self, path):
+        """
+        SHA-256 of a file, reusing the one in the manifest if the file has not been modified since.
+        """
+        stat = os.stat(path)
+        known = self.manifest["files"].get(path)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["sha256"]
+
+        sha256 = file_digest(path)
+        self.manifest["files"][path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        return sha256
+
+    @staticmethod
+    def identity(builder_name, params):
+        """
+        Hash of what is built: the builder class and its parameters.
+        """
+        payload = json.dumps({"builder": builder_name, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def inputs(self, paths):
+        """
+        Digest of each input file, by path.
+        """
+        return {path: self.digest(path) for path in sorted(set(paths))}
+
+    @staticmethod
+    def key(identity, inputs):
+        """
+        Hash of a build's identity and the contents of its inputs.
+        """
+        payload = json.dumps({"identity": identity, "inputs": inputs}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _outputs_unchanged(self, entry):
+        """
+        Whether the outputs of a build still exist with the contents it wrote. Builds with other parameters
+        may write the same paths (e.g. another style), so existing is not enough.
+        """
+        digests = entry.get("output_digests", {})
+        return all(os.path.exists(p) and digests.get(p) == self.digest(p) for p in entry["outputs"])
+
+    def lookup(self, identity, key):
+        """
+        Manifest entry of a previous build with the same key whose outputs are unchanged, or None.
+        """
+        entry = self.manifest["builds"].get(identity)
+        if entry is None or entry["key"] != key or not self._outputs_unchanged(entry):
+            return None
+        return entry
+
+    def reason(self, identity, inputs):
+        """
+        Why a build has to run: it was never built, some of its inputs changed, its outputs are missing or were
+        overwritten, or it was requested without the cache.
+        """
+        previous = self.manifest["builds"].get(identity)
+        if previous is None:
+            return "new build"
+
+        changed = sorted(path for path in inputs if previous["inputs"].get(path) != inputs[path])
+        if changed:
+            return "changed inputs: {0}".format(", ".join(changed))
+        elif not all(os.path.exists(p) for p in previous["outputs"]):
+            return "missing outputs"
+        elif not self._outputs_unchanged(previous):
+            return "changed outputs"
+        return "cache disabled"
+
+    def record(self, identity, key, builder_name, params, inputs, plot_name, outputs, reason):
+        """
+        Store a finished build in the manifest and write it to disk.
+        """
+        entry = {"key": key, "builder": builder_name, "params": params, "inputs": inputs,
+                 "plot_name": plot_name, "outputs": outputs, "output_digests": self.inputs(outputs),
+                 "reason": reason, "built_at": datetime.now().isoformat(timespec="seconds")}
+
+        # Reload before writing, holding a lock so that builds recorded meanwhile by other processes are kept
+        with open("{0}.lock".format(self.path), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            manifest = self._read()
+            manifest["builds"][identity] = entry
+            manifest["files"].update(self.manifest["files"])
+            self.manifest = manifest
+
+            temp_path = "{0}.{1}.tmp".format(self.path, os.getpid())
+            with open(temp_path, "w") as f:
+                json.dump(manifest, f, indent=2, sort_keys=True, default=str)
+            os.replace(temp_path, self.path)
+        return entry
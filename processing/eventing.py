@@ -7,72 +7,89 @@ Created on Sun Apr 19 2020
 """
 
 
-from pandas.io.json import json_normalize
 from abc import ABC, abstractmethod
-import socceraction.vaep as vaep
 import pandas as pd
+import numpy as np
 import warnings
 import os
 
 warnings.simplefilter(action='ignore', category=pd.errors.PerformanceWarning)
 
+from processing.timeline import LineupTimeline, cached_timeline
+from processing.zones import zone_network, DEFAULT_SHAPE
 from processing import PassingNetworkBuilder
-from utils import read_json
+from utils import read_json, read_statsbomb_events
 
 
 class StatsBombPassingNetwork(PassingNetworkBuilder, ABC):
+    source_name = "StatsBomb eventing data"
+
+    # Columns of 'df_passes' with the passer and the value of each pass, and whether players are located at the
+    # median of their pass origins (see 'bootstrap_network')
+    passer_column = "player_name"
+    value_column = None
+    positions_from_passes = True
+
     def __init__(self, args):
-        self.plot_type = args.plot_type
-        self.team_name = args.team_name
-        self.match_id = args.match_id
+        super(StatsBombPassingNetwork, self).__init__(args)
 
-        self.plot_name = None
         self.df_events = None
-        self.plot_title = None
+        self.team_names = None
+        self.max_minute = None
         self.names_dict = None
-        self.plot_legend = None
-        self.num_minutes = None
-        self.player_position = None
-        self.pair_pass_value = None
-        self.pair_pass_count = None
-        self.player_pass_value = None
-        self.player_pass_count = None
+
+    def input_files(self):
+        """
+        Data files the passing network is built from.
+        """
+        return ["data/eventing/lineups/{0}.json".format(self.match_id), "data/eventing/events/{0}.json".format(self.match_id)]
 
     def read_data(self):
         """
         Read StatsBomb eventing data of the selected 'match_id', generating a pandas DataFrame
-        with the events and a dictionary of player names and nicknames.
+        with the passes, substitutions and cards of the match and a dictionary of player names and nicknames.
         """
         # Player name translation dict
         lineups = read_json("data/eventing/lineups/{0}.json".format(self.match_id))
         self.names_dict = {player["player_name"]: player["player_nickname"]
                            for team in lineups for player in team["lineup"]}
+        self.team_names = [team["team_name"] for team in lineups]
+
+        # Pandas dataframe containing the events of the match, streamed from the JSON file
+        self.df_events, self.max_minute = read_statsbomb_events("data/eventing/events/{0}.json".format(self.match_id))
 
-        # Pandas dataframe containing the events of the match
-        events = read_json("data/eventing/events/{0}.json".format(self.match_id))
-        self.df_events = json_normalize(events, sep="_").assign(match_id=self.match_id)
+    def match_teams(self):
+        """
+        Names of both teams of the match, as in the lineups.
+        """
+        return self.team_names
+
+    def attacks_right(self, team_name=None):
+        """
+        StatsBomb locations are always those of a team attacking towards x=1 (x=120 in StatsBomb's range).
+        """
+        return True
 
     def compute_total_minutes(self):
         """
         Compute the maximum number of minutes that are used for the passing network.
         The idea is not to have more/less than 11 players in the team because of substitutions or red cards.
         """
-        first_red_card_minute = self.df_events[self.df_events.foul_committed_card_name.isin(["Second Yellow", "Red Card"])].minute.min()
-        first_substitution_minute = self.df_events[self.df_events.type_name == "Substitution"].minute.min()
-        max_minute = self.df_events.minute.max()
-
-        self.num_minutes = min(first_substitution_minute, first_red_card_minute, max_minute)
+        self.timeline = cached_timeline(("statsbomb", self.match_id),
+                                        lambda: LineupTimeline.from_statsbomb(self.df_events, self.max_minute))
+        self.num_minutes = self.timeline.first_change_minute()
 
     def set_text_info(self):
         """
         Set the plot's name, title and legend information based on the customization chosen with the command line arguments.
         """
         # Name of the .PNG in the plots/ folder
-        self.plot_name = "statsbomb_match{0}_{1}_{2}".format(self.match_id, self.team_name, self.plot_type)
+        self.plot_name = "statsbomb_match{0}_{1}_{2}{3}".format(self.match_id, self.team_name, self.plot_type,
+                                                                self.plot_name_suffix())
 
         # Title of the plot
-        opponent_team = [x for x in self.df_events.team_name.unique() if x != self.team_name][0]
-        self.plot_title ="{0}'s passing network against {1} (StatsBomb eventing data)".format(self.team_name, opponent_team)
+        opponent_team = [x for x in self.team_names if x != self.team_name][0]
+        self.plot_title ="{0}'s passing network against {1} ({2})".format(self.team_name, opponent_team, self.source_name)
 
         # Information in the legend
         color_meaning = "pass value (VAEP)" if self.plot_type == "pass_value" else "number of passes"
@@ -82,10 +99,30 @@ class StatsBombPassingNetwork(PassingNetworkBuilder, ABC):
     def prepare_data(self):
         pass
 
+    def _select_passes(self):
+        '''
+        Successful passes done by the selected team from 'start_minute' until the first substitution or red card
+        (or the end of the lineup segment). As minutes are whole numbers, the lineup changes are located by the
+        order of their events, so that passes in the minute of a change fall on the right side of it.
+        '''
+        first_event, last_event = self.timeline.event_bounds(self.start_minute, self.num_minutes)
+        return self.df_events[(self.df_events.type_name == "Pass") &
+                              (self.df_events.pass_outcome_name.isna()) &
+                              (self.df_events.team_name == self.team_name) &
+                              (self.df_events.index > first_event) &
+                              (self.df_events.index < last_event)].copy()
+
+    def _nicknames(self, names):
+        '''
+        Translate a column of player names into their nicknames, if available. Categorical names are translated
+        once per category, and the result holds plain strings.
+        '''
+        return names.apply(lambda x: self.names_dict.get(x) or x).astype(object)
+
     @staticmethod
     def _statsbomb_to_point(location, max_width=120, max_height=80):
         '''
-        Convert a point's coordinates from a StatsBomb's range to 0-1 range.
+        Convert a point's coordinates from a StatsBomb's range to 0-1 range. Coordinates can be scalars or arrays.
         '''
         return location[0] / max_width, 1-(location[1] / max_height)
 
@@ -98,16 +135,11 @@ class StatsBombBasicPassingNetwork(StatsBombPassingNetwork):
         """
         Prepares the five pandas DataFrames that 'draw_pass_map' needs.
         """
-        # We select all successful passes done by the selected team before the minute
-        # of the first substitution or red card.
-        df_passes = self.df_events[(self.df_events.type_name == "Pass") &
-                                   (self.df_events.pass_outcome_name.isna()) &
-                                   (self.df_events.team_name == self.team_name) &
-                                   (self.df_events.minute < self.num_minutes)].copy()
+        df_passes = self._select_passes()
 
         # If available, use player's nickname instead of full name to optimize space in plot
-        df_passes["pass_recipient_name"] = df_passes.pass_recipient_name.apply(lambda x: self.names_dict[x] if self.names_dict[x] else x)
-        df_passes["player_name"] = df_passes.player_name.apply(lambda x: self.names_dict[x] if self.names_dict[x] else x)
+        df_passes["pass_recipient_name"] = self._nicknames(df_passes.pass_recipient_name)
+        df_passes["player_name"] = self._nicknames(df_passes.player_name)
 
         # In this type of plot, both the size and color (i.e. value) mean the same: number of passes
         self.player_pass_count = df_passes.groupby("player_name").size().to_frame("num_passes")
@@ -119,41 +151,62 @@ class StatsBombBasicPassingNetwork(StatsBombPassingNetwork):
         self.pair_pass_value = df_passes.groupby("pair_key").size().to_frame("pass_value")
 
         # Average pass origin's coordinates for each player
-        df_passes["origin_pos_x"] = df_passes.location.apply(lambda x: self._statsbomb_to_point(x)[0])
-        df_passes["origin_pos_y"] = df_passes.location.apply(lambda x: self._statsbomb_to_point(x)[1])
-        self.player_position = df_passes.groupby("player_name").agg({"origin_pos_x": "median", "origin_pos_y": "median"})
+        df_passes["origin_pos_x"], df_passes["origin_pos_y"] = self._statsbomb_to_point((df_passes.location_x, df_passes.location_y))
+        df_passes["end_pos_x"], df_passes["end_pos_y"] = self._statsbomb_to_point((df_passes.pass_end_x, df_passes.pass_end_y))
+        self.player_position = self._pass_positions(df_passes, "pass_recipient_name")
+
+        self.df_passes = df_passes
 
 
 class StatsBombValuePassingNetwork(StatsBombPassingNetwork):
+    value_column = "vaep_value"
+
     def __init__(self, args):
         super(StatsBombValuePassingNetwork, self).__init__(args)
 
         # This data must be prepared on advance by running the 'prepare_vaep.py' script
         self.predictions_h5 = os.path.join("data/eventing", "predictions.h5")
+        self.spadl_h5 = os.path.join("data/eventing", "spadl-statsbomb.h5")
+
+        self.actiontypes = None
+        self.bodyparts = None
+        self.results = None
+        self.players = None
+        self.teams = None
+        self.actions = None
+
+    def input_files(self):
+        """
+        Besides StatsBomb's files, the SPADL actions and VAEP predictions prepared by 'prepare_vaep.py'.
+        """
+        return super(StatsBombValuePassingNetwork, self).input_files() + [self.spadl_h5, self.predictions_h5]
 
-        spadl_h5 = os.path.join("data/eventing", "spadl-statsbomb.h5")
-        self.actiontypes = pd.read_hdf(spadl_h5, "actiontypes")
-        self.bodyparts = pd.read_hdf(spadl_h5, "bodyparts")
-        self.results = pd.read_hdf(spadl_h5, "results")
-        self.players = pd.read_hdf(spadl_h5, "players")
-        self.teams = pd.read_hdf(spadl_h5, "teams")
+    def read_data(self):
+        """
+        Besides eventing data, read the SPADL actions of the match and their lookup tables.
+        """
+        super(StatsBombValuePassingNetwork, self).read_data()
 
-        self.actions = pd.read_hdf(spadl_h5, "actions/game_{0}".format(self.match_id))
+        self.actiontypes = pd.read_hdf(self.spadl_h5, "actiontypes")
+        self.bodyparts = pd.read_hdf(self.spadl_h5, "bodyparts")
+        self.results = pd.read_hdf(self.spadl_h5, "results")
+        self.players = pd.read_hdf(self.spadl_h5, "players")
+        self.teams = pd.read_hdf(self.spadl_h5, "teams")
+
+        self.actions = pd.read_hdf(self.spadl_h5, "actions/game_{0}".format(self.match_id))
 
     def prepare_data(self):
         """
         Prepares the five pandas DataFrames that 'draw_pass_map' needs.
         """
-        # We select all successful passes done by the selected team before the minute
-        # of the first substitution or red card.
-        df_passes = self.df_events[(self.df_events.type_name == "Pass") &
-                                   (self.df_events.pass_outcome_name.isna()) &
-                                   (self.df_events.team_name == self.team_name) &
-                                   (self.df_events.minute < self.num_minutes)].copy()
+        # socceraction is only needed (and loaded) for this plot type
+        import socceraction.vaep as vaep
+
+        df_passes = self._select_passes()
 
         # If available, use player's nickname instead of full name to optimize space in plot
-        df_passes["pass_recipient_name"] = df_passes.pass_recipient_name.apply(lambda x: self.names_dict[x] if self.names_dict[x] else x)
-        df_passes["player_name"] = df_passes.player_name.apply(lambda x: self.names_dict[x] if self.names_dict[x] else x)
+        df_passes["pass_recipient_name"] = self._nicknames(df_passes.pass_recipient_name)
+        df_passes["player_name"] = self._nicknames(df_passes.player_name)
 
         # Set the VAEP metric to each pass
         actions = (
@@ -169,7 +222,13 @@ class StatsBombValuePassingNetwork(StatsBombPassingNetwork):
         df_vaep = pd.concat([actions, preds, values], axis=1)
         df_vaep["player_name"] = df_vaep.apply(lambda x: x["player_nickname"] if x["player_nickname"] else x["player_name"], axis=1)
 
-        df_result = pd.merge(df_passes[["timestamp", "player_name", "pass_recipient_name"]], df_vaep, on=["timestamp", "player_name"], how="left")
+        # Average pass origin's coordinates for each player
+        df_passes["origin_pos_x"], df_passes["origin_pos_y"] = self._statsbomb_to_point((df_passes.location_x, df_passes.location_y))
+        df_passes["end_pos_x"], df_passes["end_pos_y"] = self._statsbomb_to_point((df_passes.pass_end_x, df_passes.pass_end_y))
+        self.player_position = self._pass_positions(df_passes, "pass_recipient_name")
+
+        df_result = pd.merge(df_passes[["timestamp", "player_name", "pass_recipient_name", "origin_pos_x", "origin_pos_y"]],
+                             df_vaep, on=["timestamp", "player_name"], how="left")
         df_result["vaep_value"] = df_result.vaep_value.apply(lambda x: x if x >= 0 else None)  # Filter out negative actions
         df_result["vaep_value"] = df_result.vaep_value.apply(lambda x: x if x >= 0 else None)  # Filter out negative actions
 
@@ -177,12 +236,36 @@ class StatsBombValuePassingNetwork(StatsBombPassingNetwork):
         self.player_pass_count = df_result.groupby("player_name").size().to_frame("num_passes")
         self.player_pass_value = df_result.groupby("player_name").agg(pass_value=("vaep_value", "mean"))
 
-        # Average pass origin's coordinates for each player
-        df_passes["origin_pos_x"] = df_passes.location.apply(lambda x: self._statsbomb_to_point(x)[0])
-        df_passes["origin_pos_y"] = df_passes.location.apply(lambda x: self._statsbomb_to_point(x)[1])
-        self.player_position = df_passes.groupby("player_name").agg({"origin_pos_x": "median", "origin_pos_y": "median"})
-
         # 'pair_key' combines the names of the passer and receiver of each pass (sorted alphabetically)
         df_result["pair_key"] = df_result.apply(lambda x: "_".join(sorted([x["player_name"], x["pass_recipient_name"]])), axis=1)
         self.pair_pass_value = df_result.groupby("pair_key").agg(pass_value=("vaep_value", "mean"))
         self.pair_pass_count = df_result.groupby("pair_key").size().to_frame("num_passes")
+
+        self.df_passes = df_result
+
+
+class StatsBombZonePassingNetwork(StatsBombPassingNetwork):
+    def __init__(self, args):
+        super(StatsBombZonePassingNetwork, self).__init__(args)
+        self.zones = tuple(getattr(args, "zones", None) or DEFAULT_SHAPE)
+        self.zone_flows = None
+
+    def set_text_info(self):
+        """
+        Nodes are zones of the pitch instead of players.
+        """
+        super(StatsBombZonePassingNetwork, self).set_text_info()
+        self.plot_legend = "Location: zones of the pitch\nSize: number of passes\nColor: number of passes"
+
+    def prepare_data(self):
+        """
+        Prepares the five pandas DataFrames that 'draw_pass_map' needs, with zones as nodes, and the dense
+        matrix of passes between zones ('zone_flows').
+        """
+        df_passes = self._select_passes()
+
+        origins = np.column_stack(self._statsbomb_to_point((df_passes.location_x.to_numpy(), df_passes.location_y.to_numpy())))
+        destinations = np.column_stack(self._statsbomb_to_point((df_passes.pass_end_x.to_numpy(), df_passes.pass_end_y.to_numpy())))
+
+        (self.player_position, self.player_pass_count, self.player_pass_value,
+         self.pair_pass_count, self.pair_pass_value, self.zone_flows) = zone_network(origins, destinations, self.zones)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 19 2020
+
+@author: Sergio Llana (@SergioMinuto90)
+"""
+
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import threading
+import shlex
+import queue
+import os
+
+from utils import parse_args
+
+
+def read_jobs(path):
+    '''
+    Arguments of every 'run.py' command in a shell script such as 'create_sample_plots.sh', one argparse.Namespace
+    per command. Other lines are ignored, as well as commands with invalid arguments (reporting them).
+    '''
+    jobs = []
+    with open(path) as f:
+        for line in f:
+            tokens = shlex.split(line, comments=True)
+            if len(tokens) > 1 and os.path.basename(tokens[1]) == "run.py":
+                args = parse_args(tokens[2:])
+                if args:
+                    jobs.append(args)
+    return jobs
+
+
+def _read_ahead(jobs, ready):
+    '''
+    Create the builder of each job and read its data, in order, putting them into the bounded 'ready' queue
+    together with the outputs of the ones that are up to date (which have no data to read).
+    '''
+    from processing import create_builder
+
+    try:
+        for args in jobs:
+            plot_builder = create_builder(args)
+            outputs = plot_builder.cached_outputs()
+            if outputs is None:
+                plot_builder.read_data()
+            ready.put((plot_builder, outputs))
+    except Exception as error:
+        ready.put(error)
+    ready.put(None)
+
+
+def _render(plot_builder):
+    '''
+    Build a passing network whose data is already read, rendering its images in memory. If it goes to a similarity
+    index, its embeddings are computed too, as the network itself stays in the worker.
+    '''
+    plot_builder.images = []
+    plot_builder.build()
+
+    embeddings = None
+    if plot_builder.similarity_index:
+        from processing.similarity import builder_embeddings
+        embeddings = builder_embeddings(plot_builder)
+    return plot_builder.plot_name, plot_builder.images, embeddings
+
+
+def _write(plot_builder, rendered):
+    '''
+    Write the images rendered for a builder (the result of its finished '_render' future), record the build
+    in the cache's manifest and, if requested, add its networks to a similarity index. As there is a single
+    writer, the index file is never updated by two jobs at once.
+    '''
+    plot_name, images, embeddings = rendered.result()
+    for path, image in images:
+        with open(path, "wb") as f:
+            f.write(image)
+
+    plot_builder.plot_name = plot_name
+    plot_builder.outputs = [path for path, _ in images]
+    plot_builder.record_build()
+
+    if embeddings:
+        from processing.similarity import add_embeddings
+        add_embeddings(plot_builder.similarity_index, embeddings)
+
+    print("{0} done!".format(plot_name))
+    return plot_builder.outputs
+
+
+def run_pipeline(jobs, prefetch=2, processes=None):
+    """
+    Build many passing networks overlapping their three stages, so that a run takes as long as its slowest stage
+    rather than the sum of all of them:
+        1. A thread reads the data of the next 'prefetch' jobs ahead (files are mostly I/O and parsing).
+        2. A pool of worker processes prepares the networks and renders them into PNG images in memory.
+        3. A thread writes the images into the 'plots' folder and records them in the cache's manifest.
+
+    Parameters
+    -----------
+        jobs: list of argparse.Namespace objects as returned by 'utils.parse_args', one per plot.
+        prefetch: number of jobs whose data is read ahead of the ones being rendered.
+        processes: number of worker processes. By default, the number of CPUs.
+
+    Returns
+    -----------
+       outputs: list with the paths of the images of each job.
+    """
+    processes = processes or os.cpu_count()
+    ready = queue.Queue(maxsize=prefetch)
+
+    # Workers are started from a clean server process rather than forked from this one, where the reading thread
+    # may be in the middle of pandas I/O
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+    outputs = [None] * len(jobs)
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context(start_method)) as renderers, \
+            ThreadPoolExecutor(max_workers=1) as writer:
+        threading.Thread(target=_read_ahead, args=(jobs, ready), daemon=True).start()
+
+        # Builders waiting for a worker hold their data in memory, so no more are handed than workers are free.
+        # Each render is handed to the writer as soon as it finishes, freeing its worker.
+        free_workers = threading.Semaphore(processes)
+        writing = queue.Queue()
+
+        def hand_over(index, plot_builder, rendered):
+            free_workers.release()
+            writing.put((index, writer.submit(_write, plot_builder, rendered)))
+
+        num_rendering = 0
+        for index, item in enumerate(iter(ready.get, None)):
+            if isinstance(item, Exception):
+                raise item
+
+            plot_builder, cached = item
+            if cached is not None:
+                print("{0} up to date".format(plot_builder.plot_name))
+                outputs[index] = cached
+                continue
+
+            free_workers.acquire()
+            rendered = renderers.submit(_render, plot_builder)
+            rendered.add_done_callback(lambda rendered, index=index, plot_builder=plot_builder:
+                                       hand_over(index, plot_builder, rendered))
+            num_rendering += 1
+
+        for _ in range(num_rendering):
+            index, written = writing.get()
+            outputs[index] = written.result()
+
+    return outputs
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 19 2020
+
+@author: Sergio Llana (@SergioMinuto90)
+"""
+
+
+import numpy as np
+import os
+
+
+def network_embedding(player_position, player_pass_count, pair_pass_count, num_roles=11, weights=(1., 1., 1.),
+                      attacks_right=True):
+    '''
+    Fixed-length float32 vector describing the structure of a passing network, so that networks of different
+    matches and teams can be compared regardless of player names. Players (the 'num_roles' with most passes) are
+    ordered by role, from the deepest to the most advanced one, and the vector concatenates three blocks, each
+    scaled to unit length and multiplied by its weight in 'weights':
+        adjacency: share of the team's passes between each pair of roles (upper triangle of the matrix).
+        positions: location of each role in 0-1 range.
+        degrees: share of the team's passes in which each player took part, sorted from highest to lowest.
+    Missing roles (e.g. after a red card) are zeros.
+
+    Positions are first rotated so that every team attacks towards x=1: teams that attack towards x=0
+    ('attacks_right' False) are turned half a turn, keeping each side of the pitch on the team's same flank.
+    '''
+    players = player_pass_count.num_passes.nlargest(num_roles).index
+    positions = np.nan_to_num(player_position.loc[players, ["origin_pos_x", "origin_pos_y"]].to_numpy(dtype=float))
+    if not attacks_right:
+        positions = 1 - positions
+    order = np.argsort(positions[:, 0], kind="stable")
+    players, positions = players[order], positions[order]
+
+    # Role-ordered adjacency matrix from the 'player1_player2' pair keys
+    roles = {player: role for role, player in enumerate(players)}
+    adjacency = np.zeros((num_roles, num_roles))
+    for pair_key, num_passes in pair_pass_count.num_passes.items():
+        player1, player2 = pair_key.split("_")
+        if player1 in roles and player2 in roles:
+            adjacency[roles[player1], roles[player2]] += num_passes
+            adjacency[roles[player2], roles[player1]] += num_passes if player1 != player2 else 0
+
+    total = adjacency[np.triu_indices(num_roles)].sum()
+    degrees = np.zeros(num_roles)
+    degrees[:len(players)] = np.sort(adjacency.sum(axis=1)[:len(players)])[::-1] / max(total, 1)
+
+    padded_positions = np.zeros((num_roles, 2))
+    padded_positions[:len(players)] = positions
+
+    blocks = [adjacency[np.triu_indices(num_roles)] / max(total, 1), padded_positions.ravel(), degrees]
+    blocks = [weight * block / max(np.linalg.norm(block), 1e-12) for weight, block in zip(weights, blocks)]
+    return np.concatenate(blocks).astype(np.float32)
+
+
+def builder_embeddings(plot_builder, **kwargs):
+    '''
+    Embedding of each network computed by a builder, as (key, vector) tuples: one per team or lineup segment
+    when the builder built several (keyed by plot name and title), or just the one keyed by its plot name.
+    '''
+    if plot_builder.networks:
+        # Networks of both teams are titled with the name of their team
+        return [("{0} {1}".format(plot_builder.plot_name, network[5]),
+                 network_embedding(network[0], network[1], network[3],
+                                   attacks_right=plot_builder.attacks_right(network[5] if plot_builder.both_teams else None),
+                                   **kwargs)) for network in plot_builder.networks]
+
+    return [(plot_builder.plot_name, network_embedding(plot_builder.player_position, plot_builder.player_pass_count,
+                                                       plot_builder.pair_pass_count,
+                                                       attacks_right=plot_builder.attacks_right(), **kwargs))]
+
+
+class NetworkIndex(object):
+    """
+    Nearest-neighbour index of passing network embeddings (see 'network_embedding'), stored as a float32 matrix
+    with one row per network and the key of each row (e.g. its plot name).
+
+    Networks are added incrementally (the matrix is preallocated and grown geometrically when full), adding a key
+    again replaces its vector, and queries compare a batch of vectors against the whole matrix at once.
+    """
+    def __init__(self, dimension, capacity=1024):
+        self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.norms = np.zeros(capacity, dtype=np.float32)
+        self.keys = []
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, vector):
+        """
+        Add the vector of a network, or replace it if its key is already in the index.
+        """
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == len(self.vectors):
+                self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+                self.norms = np.concatenate([self.norms, np.zeros_like(self.norms)])
+
+            self.keys.append(key)
+            self.rows[key] = row
+
+        self.vectors[row] = vector
+        self.norms[row] = np.linalg.norm(self.vectors[row])
+
+    def query(self, vectors, k=5, metric="cosine"):
+        """
+        Top-k most similar networks to each of the query vectors.
+
+        Parameters
+        -----------
+            vectors: array of shape (queries, dimension), or a single vector.
+            k: number of networks returned for each query.
+            metric: 'cosine' (similarity, highest first) or 'euclidean' (distance, lowest first).
+
+        Returns
+        -----------
+           keys: list with the keys of the k networks found for each query.
+           scores: float32 array of shape (queries, k) with their similarity or distance.
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        stored, norms = self.vectors[:len(self)], self.norms[:len(self)]
+        k = min(k, len(self))
+        if k == 0:
+            return [[] for _ in vectors], np.zeros((len(vectors), 0), dtype=np.float32)
+
+        products = vectors @ stored.T
+        query_norms = np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+        if metric == "cosine":
+            scores = -products / np.maximum(query_norms * norms, 1e-12)
+        elif metric == "euclidean":
+            scores = np.sqrt(np.maximum(query_norms ** 2 - 2 * products + norms ** 2, 0))
+        else:
+            raise ValueError("Unknown metric '{0}', must be 'cosine' or 'euclidean'".format(metric))
+
+        # Partial sort to keep the k best (lowest score) of each query, then sort only those
+        best = np.argpartition(scores, k - 1, axis=1)[:, :k]
+        best = np.take_along_axis(best, np.argsort(np.take_along_axis(scores, best, axis=1), axis=1), axis=1)
+
+        scores = np.take_along_axis(scores, best, axis=1)
+        scores = -scores if metric == "cosine" else scores
+        return [[self.keys[row] for row in rows] for rows in best], scores
+
+    def similar(self, key, k=5, metric="cosine"):
+        """
+        Networks most similar to one already in the index, leaving itself out.
+        """
+        keys, scores = self.query(self.vectors[self.rows[key]], k + 1, metric)
+        return [(other, score) for other, score in zip(keys[0], scores[0]) if other != key][:k]
+
+    def save(self, path):
+        """
+        Write the index into a NumPy .npz file.
+        """
+        with open(path, "wb") as f:
+            np.savez(f, vectors=self.vectors[:len(self)], keys=np.array(self.keys, dtype=str))
+
+    @classmethod
+    def load(cls, path, dimension=None):
+        """
+        Read an index written with 'save', or create an empty one of the given dimension if the file does not exist.
+        """
+        if not os.path.exists(path):
+            if dimension is None:
+                raise FileNotFoundError("Similarity index {0} does not exist (a dimension is needed to create it)".format(path))
+            return cls(dimension)
+
+        with np.load(path) as data:
+            vectors, keys = data["vectors"], data["keys"]
+
+        index = cls(vectors.shape[1], capacity=max(len(keys), 1))
+        index.vectors[:len(keys)] = vectors
+        index.norms[:len(keys)] = np.linalg.norm(vectors, axis=1)
+        index.keys = keys.tolist()
+        index.rows = {key: row for row, key in enumerate(index.keys)}
+        return index
+
+
+def add_embeddings(path, embeddings):
+    '''
+    Add (key, vector) embeddings to the index stored in 'path' (created if it does not exist).
+    '''
+    index = NetworkIndex.load(path, len(embeddings[0][1]))
+    for key, vector in embeddings:
+        index.add(key, vector)
+
+    index.save(path)
+    return index
+
+
+def update_index(path, plot_builder):
+    '''
+    Add the networks just computed by a builder to the index stored in 'path' (created if it does not exist).
+    Networks between zones (see 'processing.zones') are not comparable with those between players.
+    '''
+    if plot_builder.zones is not None:
+        raise ValueError("Zone networks cannot be added to a similarity index of player networks")
+    if plot_builder.player_position is None:
+        raise ValueError("{0} has not computed its network, so it cannot be indexed".format(type(plot_builder).__name__))
+
+    return add_embeddings(path, builder_embeddings(plot_builder))
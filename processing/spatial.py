@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 19 2020
+
+@author: Sergio Llana (@SergioMinuto90)
+"""
+
+
+import numpy as np
+
+
+def team_positions(tracking, teamname, frames, field_dimen=(106., 68.)):
+    '''
+    Positions in meters of every player of a team in the given frames, as an array of shape (frames, players, 2).
+    Players off the pitch, or frames not in the tracking data, are NaN.
+    '''
+    x_columns = [c for c in tracking.columns if c.startswith(teamname + "_") and c.endswith("_x")]
+    y_columns = [c[:-1] + "y" for c in x_columns]
+
+    # Rows of the given frames are taken first, so only those are copied out of the DataFrame
+    rows = tracking.index.get_indexer(np.asarray(frames))
+    selected = tracking.iloc[rows[rows >= 0]]
+
+    positions = np.full((len(rows), len(x_columns), 2), np.nan)
+    positions[rows >= 0] = np.stack([selected[x_columns].to_numpy(), selected[y_columns].to_numpy()], axis=-1)
+    return positions * np.asarray(field_dimen)
+
+
+def nearest_distance(points, players):
+    '''
+    Distance from each point (n, 2) to the closest of its players (n, p, 2), NaN if none is on the pitch.
+    '''
+    distances = np.sqrt(((players - points[:, np.newaxis, :]) ** 2).sum(axis=-1))
+    nearest = np.where(np.isnan(distances), np.inf, distances).min(axis=1)
+    return np.where(np.isinf(nearest), np.nan, nearest)
+
+
+def players_near_segment(starts, ends, players, radius):
+    '''
+    Number of players (n, p, 2) within 'radius' of each segment going from starts (n, 2) to ends (n, 2).
+    '''
+    segments = ends - starts
+    squared_lengths = (segments ** 2).sum(axis=-1)[:, np.newaxis]
+
+    # Projection of each player on its segment, clipped to the segment's ends
+    relative = players - starts[:, np.newaxis, :]
+    projections = (relative * segments[:, np.newaxis, :]).sum(axis=-1)
+    projections = np.divide(projections, squared_lengths, out=np.zeros_like(projections), where=squared_lengths > 0)
+    closest = segments[:, np.newaxis, :] * np.clip(projections, 0, 1)[..., np.newaxis]
+
+    distances = np.sqrt(((relative - closest) ** 2).sum(axis=-1))
+    return (distances <= radius).sum(axis=1)
+
+
+def pass_pressure_metrics(df_passes, tracking, opponent, radius=3.0, batch_size=1024, field_dimen=(106., 68.)):
+    """
+    Attach to each pass how much pressure the passer was under and how open the passing lane was, from the
+    opponents' positions at the pass's 'Start Frame':
+        passer_pressure: distance in meters from the passer to the nearest opponent.
+        lane_opponents: number of opponents within 'radius' meters of the segment from passer to receiver.
+
+    Parameters
+    -----------
+        df_passes: pandas DataFrame of passes with 'Start Frame' and the passer ('origin_pos_x', 'origin_pos_y') and
+                   receiver ('destination_pos_x', 'destination_pos_y') coordinates in 0-1 range.
+        tracking: tracking DataFrame containing the opponent's players (e.g. the opponent's own tracking data).
+        opponent: name of the opponent team in the tracking columns ('Home' or 'Away').
+        radius: distance in meters to consider that an opponent covers a passing lane.
+        batch_size: number of passes whose (passes x opponents) distance matrices are computed at once.
+        field_dimen: dimensions of the pitch in meters.
+
+    With a dozen opponents per frame, batched dense distance matrices are cheaper than building a spatial
+    index for every frame.
+    """
+    scale = np.asarray(field_dimen)
+    origins = df_passes[["origin_pos_x", "origin_pos_y"]].to_numpy() * scale
+    destinations = df_passes[["destination_pos_x", "destination_pos_y"]].to_numpy() * scale
+    frames = df_passes["Start Frame"].to_numpy()
+
+    pressure = np.empty(len(frames))
+    lane_opponents = np.empty(len(frames), dtype=int)
+    for start in range(0, len(frames), batch_size):
+        batch = slice(start, start + batch_size)
+        opponents = team_positions(tracking, opponent, frames[batch], field_dimen)
+
+        pressure[batch] = nearest_distance(origins[batch], opponents)
+        lane_opponents[batch] = players_near_segment(origins[batch], destinations[batch], opponents, radius)
+
+    return df_passes.assign(passer_pressure=pressure, lane_opponents=lane_opponents)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 19 2020
+
+@author: Sergio Llana (@SergioMinuto90)
+"""
+
+
+from multiprocessing import shared_memory
+import multiprocessing
+import pandas as pd
+import numpy as np
+import copy
+
+from utils import read_event_data, tracking_data, CoordinateTransform
+
+
+class SharedFrame(object):
+    """
+    Numeric pandas DataFrame whose values live in shared memory, so that several processes can read it without
+    copies. Instances are picklable handles: unpickled copies attach to the same memory blocks, and 'frame()'
+    returns a read-only DataFrame that is a view on them.
+    """
+    def __init__(self, values_name, index_name, shape, columns, index_label, dtype):
+        self.values_name = values_name
+        self.index_name = index_name
+        self.shape = shape
+        self.columns = columns
+        self.index_label = index_label
+        self.dtype = dtype
+
+        self._owner = False
+        self._blocks = None
+        self._frame = None
+
+    @classmethod
+    def create(cls, df, dtype=np.float32):
+        """
+        Copy a DataFrame (cast to a single 'dtype') and its integer index into new shared memory blocks.
+        """
+        values = df.to_numpy(dtype=dtype)
+        index = df.index.to_numpy(dtype=np.int64)
+
+        blocks = []
+        for array in [values, index]:
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            blocks.append(block)
+
+        shared_frame = cls(blocks[0].name, blocks[1].name, values.shape, list(df.columns), df.index.name, np.dtype(dtype).str)
+        shared_frame._owner = True
+        shared_frame._blocks = blocks
+        return shared_frame
+
+    def frame(self):
+        """
+        Read-only DataFrame backed by the shared memory blocks (attached on first use in each process).
+        """
+        if self._frame is None:
+            if self._blocks is None:
+                self._blocks = [shared_memory.SharedMemory(name=name) for name in [self.values_name, self.index_name]]
+
+            values = np.ndarray(self.shape, dtype=self.dtype, buffer=self._blocks[0].buf)
+            index = np.ndarray(self.shape[:1], dtype=np.int64, buffer=self._blocks[1].buf)
+            values.flags.writeable = False
+            index.flags.writeable = False
+
+            self._frame = pd.DataFrame(values, index=pd.Index(index, name=self.index_label, copy=False),
+                                       columns=self.columns, copy=False)
+        return self._frame
+
+    def close(self):
+        """
+        Detach from the shared memory blocks, releasing them if this is the process that created them.
+        """
+        self._frame = None
+        for block in self._blocks or []:
+            block.close()
+            if self._owner:
+                block.unlink()
+        self._blocks = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_owner=False, _blocks=None, _frame=None)
+        return state
+
+
+class MatchStore(object):
+    """
+    Metrica match loaded once and shared by every builder that uses it, in this or in other processes.
+
+    Eventing data is small and travels with the store when it is pickled, whereas each team's tracking data
+    (coordinates already in a single playing direction) is kept in shared memory and handed out as zero-copy
+    read-only views. Builders use the store when it is given as the 'store' argument.
+    """
+    def __init__(self, match_id, data_path="data/tracking", teams=("Home", "Away")):
+        self.match_id = match_id
+
+        df_events = read_event_data(data_path, match_id)
+        df_events['Minute'] = df_events['Start Time [s]'] / 60.0
+        self.df_events = CoordinateTransform(df_events).apply()
+
+        self.teams = {}
+        for team in teams:
+            df_tracking = tracking_data(data_path, match_id, team, dtype=np.float32)
+            self.teams[team] = SharedFrame.create(CoordinateTransform(df_tracking).apply())
+
+    def events(self):
+        """
+        Eventing data of the match, with coordinates in a single playing direction.
+        """
+        return self.df_events
+
+    def tracking(self, team_name):
+        """
+        Read-only tracking data of a team, with coordinates in a single playing direction.
+        """
+        return self.teams[team_name].frame()
+
+    def close(self):
+        """
+        Release the shared memory blocks of the store.
+        """
+        for shared_frame in self.teams.values():
+            shared_frame.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Store attached by each worker process of 'build_variants'
+_worker_store = None
+
+
+def _init_worker(store):
+    global _worker_store
+    _worker_store = store
+
+
+def _build_variant(args):
+    from processing import create_builder
+
+    args = copy.copy(args)
+    args.store = _worker_store
+    plot_builder = create_builder(args)
+    plot_builder.build_and_save()
+    return plot_builder.plot_name
+
+
+def build_variants(store, variants, processes=None):
+    """
+    Build several passing networks of the same Metrica match (e.g. both teams and every context filter) in a pool
+    of worker processes that all read the match from 'store', so memory use stays close to that of one build.
+
+    Parameters
+    -----------
+        store: MatchStore of the match.
+        variants: list of argparse.Namespace objects as returned by 'utils.parse_args', one per network.
+        processes: number of worker processes. By default, the number of CPUs.
+
+    Returns
+    -----------
+       plot_names: list with the name of each plot built.
+    """
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(store,)) as pool:
+        return pool.map(_build_variant, variants)
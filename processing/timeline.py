@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 19 2020
+
+@author: Sergio Llana (@SergioMinuto90)
+"""
+
+
+import pandas as pd
+import numpy as np
+
+
+# Timelines already built in this process, by (data source, match_id, ...) key
+_timelines = {}
+
+
+def cached_timeline(key, build):
+    '''
+    Return the lineup timeline stored under 'key', building it with 'build()' only the first time.
+    '''
+    if key not in _timelines:
+        _timelines[key] = build()
+    return _timelines[key]
+
+
+class LineupTimeline(object):
+    """
+    Index of the on-pitch intervals of every player of a match, and of the minutes when a lineup changes
+    (a player comes on or is sent off). It is built once per match and makes both the minute cutoff of
+    the passing networks and the split of a match into stable-lineup segments constant-time lookups.
+
+    intervals: pandas DataFrame indexed by player with columns 'team', 'start_minute' and 'end_minute'.
+    changes: pandas DataFrame with columns 'team' and 'minute', one row per lineup change. When known, its
+             'event' column holds the order of the change among the events of the match.
+    max_minute: last minute of the match.
+    """
+    def __init__(self, intervals, changes, max_minute):
+        self.intervals = intervals
+        self.changes = changes
+        self.max_minute = max_minute
+
+        changes = changes[changes.minute < max_minute]
+        self._change_minutes = {None: np.unique(changes.minute.to_numpy())}
+        for team, team_changes in changes.groupby("team"):
+            self._change_minutes[team] = np.unique(team_changes.minute.to_numpy())
+
+    def change_minutes(self, team=None):
+        '''
+        Sorted minutes when the lineup of 'team' (of any team if None) changes.
+        '''
+        return self._change_minutes.get(team, np.array([]))
+
+    def first_change_minute(self, team=None):
+        '''
+        Minute of the first lineup change of 'team' (of any team if None), or the end of the match if there is none.
+        '''
+        change_minutes = self.change_minutes(team)
+        return change_minutes[0] if len(change_minutes) else self.max_minute
+
+    def segments(self, team=None):
+        '''
+        List of (start_minute, end_minute) intervals during which the lineup of 'team' (of any team if None) is stable.
+        '''
+        boundaries = np.concatenate([[0], self.change_minutes(team), [self.max_minute]])
+        return [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if start < end]
+
+    def event_bounds(self, start_minute, end_minute, team=None):
+        '''
+        Order of the events that bound the segment between both minutes: the last lineup change of 'start_minute'
+        and the first one of 'end_minute'. Events strictly between them happened with a stable lineup, including
+        those of the minutes of both changes. Ends without a change (start or end of the match) are unbounded.
+        '''
+        changes = self.changes if team is None else self.changes[self.changes.team == team]
+        first_event = changes.event[changes.minute == start_minute].max()
+        last_event = changes.event[(changes.minute == end_minute) & (end_minute < self.max_minute)].min()
+        return (-np.inf if np.isnan(first_event) else first_event), (np.inf if np.isnan(last_event) else last_event)
+
+    def on_pitch(self, start_minute, end_minute, team=None):
+        '''
+        Players (of 'team' if given) on the pitch during the whole interval between both minutes.
+        '''
+        intervals = self.intervals if team is None else self.intervals[self.intervals.team == team]
+        return intervals[(intervals.start_minute <= start_minute) & (intervals.end_minute >= end_minute)].index.tolist()
+
+    @classmethod
+    def from_statsbomb(cls, df_events, max_minute):
+        """
+        Build the timeline from the 'Starting XI', substitution and card events of a StatsBomb match.
+        """
+        starters = df_events[df_events.type_name == "Starting XI"]
+        substitutions = df_events[df_events.type_name == "Substitution"]
+        red_cards = df_events[df_events.foul_committed_card_name.isin(["Second Yellow", "Red Card"])]
+
+        intervals = pd.concat([
+            pd.DataFrame({"team": starters.team_name.to_numpy(), "start_minute": 0},
+                         index=starters.player_name.to_numpy()),
+            pd.DataFrame({"team": substitutions.team_name.to_numpy(), "start_minute": substitutions.minute.to_numpy()},
+                         index=substitutions.substitution_replacement_name.to_numpy())
+        ])
+        intervals["end_minute"] = max_minute
+
+        # Players leave the pitch when they are replaced or sent off
+        leaving = pd.concat([substitutions, red_cards])
+        leaving = leaving[leaving.player_name.isin(intervals.index)]
+        intervals.loc[leaving.player_name.to_numpy(), "end_minute"] = leaving.minute.to_numpy()
+
+        changes = pd.DataFrame({"team": np.concatenate([substitutions.team_name.to_numpy(), red_cards.team_name.to_numpy()]),
+                                "minute": np.concatenate([substitutions.minute.to_numpy(), red_cards.minute.to_numpy()]),
+                                "event": np.concatenate([substitutions.index.to_numpy(), red_cards.index.to_numpy()])})
+        return cls(intervals, changes, max_minute)
+
+    @classmethod
+    def from_metrica(cls, df_events, appearances, team_name, max_minute):
+        """
+        Build the timeline of a Metrica team from the first and last time each player has a position in tracking
+        data (see 'utils.player_appearances') and the red cards in eventing data.
+
+        As Metrica does not provide an event type for substitutions, a substitute is known to enter the pitch
+        when he stops having NaN in his tracking column.
+        """
+        appearances = appearances.dropna()
+        start_minute = appearances.first_time.to_numpy() / 60.0
+        substitutes = start_minute > appearances.first_time.min() / 60.0
+
+        intervals = pd.DataFrame({"team": team_name, "start_minute": np.where(substitutes, start_minute, 0),
+                                  "end_minute": appearances.last_time.to_numpy() / 60.0},
+                                 index=["Player{0}".format(c.split("_")[-1]) for c in appearances.index])
+
+        red_cards = df_events[(df_events["Type"] == "CARD") & (df_events["Subtype"] == "RED")]
+        sent_off = red_cards[red_cards["From"].isin(intervals.index)]
+        intervals.loc[sent_off["From"].to_numpy(), "end_minute"] = sent_off["Minute"].to_numpy()
+
+        changes = pd.DataFrame({"team": np.concatenate([np.repeat(team_name, substitutes.sum()), red_cards["Team"].to_numpy()]),
+                                "minute": np.concatenate([start_minute[substitutes], red_cards["Minute"].to_numpy()])})
+        return cls(intervals, changes, max_minute)
@@ -9,74 +9,134 @@ Created on Sun Apr 19 2020
 
 from abc import ABC, abstractmethod
 import pandas as pd
+import numpy as np
 
-from utils import read_json, read_event_data, tracking_data, to_single_playing_direction
+from utils import read_event_data, tracking_data, player_appearances, tracking_appearances, player_positions_at, \
+    coordinate_columns, kick_off_x, CoordinateTransform
+from processing.spatial import pass_pressure_metrics
+from processing.timeline import LineupTimeline, cached_timeline
+from processing.zones import zone_network, DEFAULT_SHAPE
 from processing import PassingNetworkBuilder
 
 
 class MetricaPassingNetwork(PassingNetworkBuilder, ABC):
+    source_name = "Metrica Sports tracking data"
+
+    # Columns of 'df_passes' with the passer and the value of each pass, and whether players are located at the
+    # median of their pass origins (see 'bootstrap_network')
+    passer_column = "From"
+    value_column = None
+    positions_from_passes = True
+
     def __init__(self, args):
+        super(MetricaPassingNetwork, self).__init__(args)
         self.context = getattr(args, "context", None)
         self.half = getattr(args, "half", None)
-        self.plot_type = args.plot_type
-        self.team_name = args.team_name
-        self.match_id = args.match_id
+        self.data_path = "data/tracking"
+        self.store = getattr(args, "store", None)
 
-        self.plot_name = None
         self.df_events = None
-        self.plot_title = None
-        self.plot_legend = None
         self.df_tracking = None
-        self.num_minutes = None
-        self.player_position = None
-        self.pair_pass_value = None
-        self.pair_pass_count = None
-        self.player_pass_value = None
-        self.player_pass_count = None
+        self.tracking_transform = None
+
+    def input_files(self):
+        """
+        Data files the passing network is built from: eventing data and the selected team's tracking data,
+        where substitutions are found (both teams' with '--both-teams').
+        """
+        teams = self.match_teams() if self.both_teams else [self.team_name]
+        return ["{0}/Sample_Game_{1}/Sample_Game_{1}_RawEventsData.csv".format(self.data_path, self.match_id)] + \
+               [self._tracking_file(team_name) for team_name in teams]
+
+    def _tracking_file(self, team_name):
+        return "{0}/Sample_Game_{1}/Sample_Game_{1}_RawTrackingData_{2}_Team.csv".format(self.data_path, self.match_id, team_name)
 
     def read_data(self):
         """
-        Read Metrica eventing and tracking data of the selected 'match_id', generating two pandas DataFrames.
+        Read Metrica eventing data of the selected 'match_id'. Tracking positions are read by the builders that need them.
         Data's X coordinate must be reversed in the second period, as we need the same attacking direction in both periods.
         """
-        data_path = "data/tracking"
+        if self.store is not None:
+            self.df_events = self.store.events()
+            return
 
-        # Read both tracking and eventing data
-        df_events = read_event_data(data_path, self.match_id)
+        df_events = read_event_data(self.data_path, self.match_id)
         df_events['Minute'] = df_events['Start Time [s]'] / 60.0
 
-        df_tracking_home = tracking_data(data_path, self.match_id, "Home")
-        df_tracking_away = tracking_data(data_path, self.match_id, "Away")
-        df_tracking_home, df_tracking_away, df_events = to_single_playing_direction(df_tracking_home, df_tracking_away, df_events)
+        self.df_events = CoordinateTransform(df_events).apply()
 
-        self.df_events = df_events
-        self.df_tracking = df_tracking_home if self.team_name == "Home" else df_tracking_away
+    def match_teams(self):
+        """
+        Metrica's sample games name their teams after the side they play on.
+        """
+        return ["Home", "Away"]
 
     def compute_total_minutes(self):
         """
         Compute the maximum number of minutes that are used for the passing network.
         The idea is not to have more/less than 11 players in the team because of substitutions or red cards.
 
-        As Metrica does not provide an event type for substitutions, tracking data is used to know when the first
-        player is introduced in the pitch (player number 12), as he would not have NaN in his column anymore.
+        As Metrica does not provide an event type for substitutions, tracking data is used to know when each
+        substitute is introduced in the pitch (see 'LineupTimeline.from_metrica').
+        """
+        self.timeline = cached_timeline(self._timeline_key(),
+                                        lambda: LineupTimeline.from_metrica(self.df_events, self._player_appearances(),
+                                                                            self.team_name, self.df_events["Minute"].max()))
+        self.num_minutes = self.timeline.first_change_minute()
+
+    def attacks_right(self, team_name=None):
+        """
+        Whether a team ('team_name', the selected one by default) attacks towards x=1. Metrica keeps the real
+        playing direction of the first period (the second one is reversed to match it), so it is the team whose
+        players line up in the half of x=0 for the kick off.
         """
-        max_minute = self.df_events["Minute"].max()
-        first_substitution_player = self.df_tracking.columns[24]
-        first_substitution_minute = self.df_tracking[~self.df_tracking[first_substitution_player].isna()]["Time [s]"].min()/60.0
-        first_red_card_minute = self.df_events[(self.df_events["Type"] == "CARD") & (self.df_events["Subtype"] == "RED")]["Minute"].min()
+        team_name = team_name or self.team_name
+        if self.store is not None:
+            df_tracking = self.store.tracking(team_name)
+            x_columns = [col for col in df_tracking.columns if col.startswith(team_name + "_") and col.endswith("_x")]
+            return np.nanmean(df_tracking[x_columns].iloc[:25].to_numpy()) < 0.5
 
-        self.num_minutes = min(first_substitution_minute, first_red_card_minute, max_minute)
+        return kick_off_x(self.data_path, self.match_id, team_name) < 0.5
+
+    def _timeline_key(self):
+        """
+        Key of the team's timeline among those already built in this process.
+        """
+        return "metrica", self.match_id, self.team_name
+
+    def _player_appearances(self):
+        """
+        First and last time each player of the selected team has a position in tracking data.
+        """
+        if self.store is not None:
+            df_tracking = self.store.tracking(self.team_name)
+            return tracking_appearances(df_tracking, [col for col in df_tracking.columns if col.endswith("_x") and col != "ball_x"])
+
+        return player_appearances(self.data_path, self.match_id, self.team_name)
+
+    def _read_tracking(self, team_name, step=1):
+        """
+        Tracking data of a team, decimated to one every 'step' frames, and the transform of its coordinates.
+        When the builder was given a match store, data comes (already transformed) from it instead of the CSV files.
+        """
+        if self.store is not None:
+            df_tracking = self.store.tracking(team_name).iloc[::step]
+            return df_tracking, CoordinateTransform(df_tracking, transformed=coordinate_columns(df_tracking))
+
+        df_tracking = tracking_data(self.data_path, self.match_id, team_name, step=step, dtype=np.float32)
+        return df_tracking, CoordinateTransform(df_tracking)
 
     def set_text_info(self):
         """
         Set the plot's name, title and legend information based on the customization chosen with the command line arguments.
         """
         # Name of the .PNG in the plots/ folder
-        self.plot_name = "metrica_match{0}_{1}_{2}".format(self.match_id, self.team_name, self.plot_type)
+        self.plot_name = "metrica_match{0}_{1}_{2}{3}".format(self.match_id, self.team_name, self.plot_type,
+                                                              self.plot_name_suffix())
 
         # Title of the plot
         opponent_team = "Away" if self.team_name == "Home" else "Home"
-        self.plot_title ="{0}'s passing network against {1} (Metrica Sports tracking data)".format(self.team_name, opponent_team)
+        self.plot_title ="{0}'s passing network against {1} ({2})".format(self.team_name, opponent_team, self.source_name)
 
         # Information in the legend
         if self.context or self.half:
@@ -93,13 +153,25 @@ class MetricaPassingNetwork(PassingNetworkBuilder, ABC):
         else:
             context_meaning = ""
 
-        location_meaning = "players avg. position" if self.plot_type == "tracking" else "pass origin"
+        location_meaning = {"tracking": "players avg. position",
+                            "pass_time": "players position when passing/receiving",
+                            "zones": "zones of the pitch"}.get(self.plot_type, "pass origin")
         self.plot_legend = "{0}Location: {1}\nSize: number of passes\nColor: number of passes".format(context_meaning, location_meaning)
 
     @abstractmethod
     def prepare_data(self):
         pass
 
+    def _select_passes(self):
+        '''
+        Passes done by the selected team from 'start_minute' until the minute of the first substitution or red card
+        (or the end of the lineup segment).
+        '''
+        return self.df_events[(self.df_events["Type"] == "PASS") &
+                              (self.df_events["Team"] == self.team_name) &
+                              (self.df_events["Minute"] >= self.start_minute) &
+                              (self.df_events["Minute"] < self.num_minutes)].copy()
+
 
 class MetricaBasicPassingNetwork(MetricaPassingNetwork):
     def __init__(self, args):
@@ -109,12 +181,10 @@ class MetricaBasicPassingNetwork(MetricaPassingNetwork):
         """
         Prepares the five pandas DataFrames that 'draw_pass_map' needs.
         """
-        # We select all passes done by the selected team before the minute of the first substitution or red card.
-        df_passes = self.df_events[(self.df_events["Type"] == "PASS") &
-                                   (self.df_events["Team"] == self.team_name) &
-                                   (self.df_events["Minute"] < self.num_minutes)].copy()
+        df_passes = self._select_passes()
 
-        df_passes = df_passes.rename(columns={"Start X": "origin_pos_x", "Start Y": "origin_pos_y"})
+        df_passes = df_passes.rename(columns={"Start X": "origin_pos_x", "Start Y": "origin_pos_y",
+                                              "End X": "end_pos_x", "End Y": "end_pos_y"})
 
         # In this type of plot, both the size and color (i.e. value) mean the same: number of passes
         self.player_pass_value = df_passes.groupby("From").size().to_frame("pass_value")
@@ -126,22 +196,127 @@ class MetricaBasicPassingNetwork(MetricaPassingNetwork):
         self.pair_pass_count = df_passes.groupby("pair_key").size().to_frame("num_passes")
 
         # Average pass origin's coordinates for each player
-        self.player_position = df_passes.groupby("From").agg({"origin_pos_x": "median", "origin_pos_y": "median"})
+        self.player_position = self._pass_positions(df_passes, "To")
+
+        self.df_passes = df_passes
+
+
+class MetricaZonePassingNetwork(MetricaPassingNetwork):
+    def __init__(self, args):
+        super(MetricaZonePassingNetwork, self).__init__(args)
+        self.zones = tuple(getattr(args, "zones", None) or DEFAULT_SHAPE)
+        self.zone_flows = None
+
+    def prepare_data(self):
+        """
+        Prepares the five pandas DataFrames that 'draw_pass_map' needs, with zones as nodes, and the dense
+        matrix of passes between zones ('zone_flows').
+        """
+        df_passes = self._select_passes()
+
+        origins = df_passes[["Start X", "Start Y"]].to_numpy(dtype=float)
+        destinations = df_passes[["End X", "End Y"]].to_numpy(dtype=float)
+
+        (self.player_position, self.player_pass_count, self.player_pass_value,
+         self.pair_pass_count, self.pair_pass_value, self.zone_flows) = zone_network(origins, destinations, self.zones)
 
 
 class MetricaTrackingPassingNetwork(MetricaPassingNetwork):
+    positions_from_passes = False
+
     def __init__(self, args):
         super(MetricaTrackingPassingNetwork, self).__init__(args)
+        self.frame_step = getattr(args, "frame_step", None) or 1
+        self.frame_step_report = getattr(args, "frame_step_report", False)
+        self.possession_frames = None
+        self.team_tracking = {}
+        self.full_tracking = {}
+
+        # The error report is only printed when the network is actually built
+        self.use_cache = self.use_cache and not self.frame_step_report
+
+    def plot_name_suffix(self):
+        """
+        Plots from decimated tracking data are named after their frame step, apart from the full resolution ones.
+        """
+        suffix = super(MetricaTrackingPassingNetwork, self).plot_name_suffix()
+        return suffix + ("_step{0}".format(self.frame_step) if self.frame_step > 1 else "")
+
+    def read_data(self):
+        """
+        Besides eventing data, read the positions of the selected team's players and the ball (of both teams
+        with '--both-teams'), decimated to one every 'frame_step' frames if requested. Other tracking files are
+        not read at all. Tracking coordinates are only transformed (through 'tracking_transform') when a builder
+        reads them.
+        """
+        super(MetricaTrackingPassingNetwork, self).read_data()
+
+        for team_name in self.match_teams() if self.both_teams else [self.team_name]:
+            self._team_tracking(team_name)
+
+        if self.team_name is not None:
+            self.select_team(self.team_name)
+
+    def _team_tracking(self, team_name):
+        """
+        Tracking data of a team and the transform of its coordinates, read once per builder.
+        """
+        if team_name not in self.team_tracking:
+            self.team_tracking[team_name] = self._read_tracking(team_name, self.frame_step)
+        return self.team_tracking[team_name]
+
+    def _full_tracking(self, team_name):
+        """
+        Tracking data of a team with every frame, for the '--frame-step-report', read once per builder.
+        """
+        if team_name not in self.full_tracking:
+            self.full_tracking[team_name] = self._read_tracking(team_name)
+        return self.full_tracking[team_name]
+
+    def select_team(self, team_name):
+        """
+        Point 'df_tracking' and 'tracking_transform' to the tracking data of the team.
+        """
+        super(MetricaTrackingPassingNetwork, self).select_team(team_name)
+        self.df_tracking, self.tracking_transform = self._team_tracking(team_name)
+
+    def _timeline_key(self):
+        """
+        Appearances come from the tracking data in memory, which may be decimated, so timelines built from
+        different frame steps are kept apart.
+        """
+        return "metrica", self.match_id, self.team_name, self.frame_step
+
+    def _player_appearances(self):
+        """
+        Players' appearances are taken from the tracking data already in memory.
+        """
+        x_columns = [col for col in self.df_tracking.columns if col.endswith("_x") and col != "ball_x"]
+        return tracking_appearances(self.df_tracking, x_columns)
 
     def _context_frames(self):
         """
-        Basic algorithm to detect ball possession changes.
+        Basic algorithm to detect ball possession changes, computed once per builder and shared by both teams.
         Note that frames out of effective playing time are not considered.
 
         Returns
         -----------
-            on_ball_frames: set of frames when the selected team was in possession of the ball (i.e. attacking).
-            off_ball_frames: set of frames when the selected team had not the possession (i.e. defending).
+            on_ball_windows: list of (first, last) frame windows (last not included) when the selected team was in
+                             possession of the ball (i.e. attacking).
+            off_ball_windows: list of (first, last) frame windows when the selected team had not the possession
+                              (i.e. defending).
+        """
+        if self.possession_frames is None:
+            self.possession_frames = self._possession_windows()
+
+        on_ball_windows = self.possession_frames.get(self.team_name, [])
+        off_ball_windows = [window for team_name, windows in self.possession_frames.items()
+                            if team_name != self.team_name for window in windows]
+        return on_ball_windows, off_ball_windows
+
+    def _possession_windows(self):
+        """
+        Dictionary with the list of (first, last) frame windows when each team was in possession of the ball.
         """
         df_events_simple = self.df_events[~self.df_events.Type.isin(["CHALLENGE", "CARD"])].reset_index(drop=True)
         possession_start_events = ['PASS', 'RECOVERY', 'SET PIECE', 'SHOT']
@@ -149,8 +324,7 @@ class MetricaTrackingPassingNetwork(MetricaPassingNetwork):
 
         current_window_start = self.df_events[self.df_events["Subtype"] == "KICK OFF"].iloc[0]["Start Frame"]
 
-        on_ball_frames = set()
-        off_ball_frames = set()
+        possession_windows = {}
         for event_index, row in df_events_simple.iterrows():
             event_type = row["Type"]
             if event_type in possession_change_events:
@@ -163,20 +337,34 @@ class MetricaTrackingPassingNetwork(MetricaPassingNetwork):
                 if next_starts.shape[0] > 0:
                     next_start = next_starts.iloc[0]
 
-                    frames_set = on_ball_frames if row["Team"] == self.team_name else off_ball_frames
-                    frames_set.update(range(current_window_start, current_window_end))
+                    possession_windows.setdefault(row["Team"], []).append((current_window_start, current_window_end))
 
                     current_window_start = next_start["Start Frame"]
 
-        return on_ball_frames, off_ball_frames
+        return possession_windows
+
+    @staticmethod
+    def _in_windows(frames, windows):
+        """
+        Boolean mask of the frames that fall in any of the (first, last) windows, computed with a
+        difference array instead of enumerating every frame of every window.
+        """
+        frames = np.asarray(frames)
+        if not windows or not len(frames):
+            return np.zeros(len(frames), dtype=bool)
+
+        first, last = np.array(windows).T
+        coverage = np.zeros(max(frames.max(), last.max()) + 2, dtype=int)
+        valid = first < last
+        np.add.at(coverage, first[valid], 1)
+        np.add.at(coverage, last[valid], -1)
+        return np.cumsum(coverage)[frames] > 0
 
     def prepare_data(self):
         """
         Prepares the five pandas DataFrames that 'draw_pass_map' needs.
         """
-        df_passes = self.df_events[(self.df_events["Type"] == "PASS") &
-                                   (self.df_events["Team"] == self.team_name) &
-                                   (self.df_events["Minute"] < self.num_minutes)].copy()
+        df_passes = self._select_passes()
 
         df_passes = df_passes.rename(columns={"Start X": "origin_pos_x", "Start Y": "origin_pos_y"})
 
@@ -191,49 +379,132 @@ class MetricaTrackingPassingNetwork(MetricaPassingNetwork):
 
         # In this type of plot, instead of averaging the location of the pass origins, we use tracking data
         # to compute player's average location
-        df_tracking = self.df_tracking[(self.df_tracking.index < df_passes["End Frame"].max())]
+        self.player_position = self._average_positions(self.df_tracking, self.tracking_transform, df_passes)
+        self.df_passes = df_passes
+
+        # Different filters are applied depending on the customization chosen in the command line arguments
+        if self.context:
+            self.plot_name = "{0}_{1}".format(self.plot_name, self.context)
+        if self.half:
+            self.plot_name = "{0}_{1}".format(self.plot_name, self.half)
+
+        if self.frame_step_report and self.frame_step > 1:
+            self._report_frame_step_error(df_passes)
+
+    def _average_positions(self, df_tracking, tracking_transform, df_passes):
+        """
+        Median location of each player in the tracking frames selected with the command line arguments.
+        """
         x_columns = [col for col in df_tracking.columns if col.endswith("_x") and col != "ball_x"]
         y_columns = [col for col in df_tracking.columns if col.endswith("_y") and col != "ball_y"]
+        tracking_transform.apply(x_columns + y_columns + ["ball_x"])
+        df_selected = df_tracking[(df_tracking["Time [s]"] >= self.start_minute * 60) &
+                                  (df_tracking.index < df_passes["End Frame"].max())]
 
-        # Different filters are applied depending on the customization chosen in the command line arguments
         if self.context == "attacking":
-            frames, _ = self._context_frames()
-            df_tracking = df_tracking[df_tracking.index.isin(frames)]
-            self.plot_name = "{0}_{1}".format(self.plot_name, self.context)
+            windows, _ = self._context_frames()
+            df_selected = df_selected[self._in_windows(df_selected.index, windows)]
         elif self.context == "defending":
-            _, frames = self._context_frames()
-            df_tracking = df_tracking[df_tracking.index.isin(frames)]
-            self.plot_name = "{0}_{1}".format(self.plot_name, self.context)
+            _, windows = self._context_frames()
+            df_selected = df_selected[self._in_windows(df_selected.index, windows)]
 
         if self.half:
+            # First frame at (or, with decimated data, right after) the kick off
             match_start = self.df_events[self.df_events["Subtype"] == "KICK OFF"].iloc[0]["Start Frame"]
-            mean_x = self.df_tracking.loc[self.df_tracking.index == match_start, x_columns].mean().mean()
+            mean_x = df_tracking[x_columns].iloc[df_tracking.index.searchsorted(match_start)].mean()
 
             if self.half == "own_half":
                 if mean_x < 0.5:
-                    df_tracking = df_tracking[df_tracking["ball_x"] < 0.5]
+                    df_selected = df_selected[df_selected["ball_x"] < 0.5]
                 else:
-                    df_tracking = df_tracking[df_tracking["ball_x"] >= 0.5]
-
-                self.plot_name = "{0}_{1}".format(self.plot_name, self.half)
+                    df_selected = df_selected[df_selected["ball_x"] >= 0.5]
             else:
                 if mean_x < 0.5:
-                    df_tracking = df_tracking[df_tracking["ball_x"] >= 0.5]
+                    df_selected = df_selected[df_selected["ball_x"] >= 0.5]
                 else:
-                    df_tracking = df_tracking[df_tracking["ball_x"] < 0.5]
+                    df_selected = df_selected[df_selected["ball_x"] < 0.5]
 
-                self.plot_name = "{0}_{1}".format(self.plot_name, self.half)
+        player_position = pd.DataFrame({"origin_pos_x": df_selected[x_columns].median().to_numpy(),
+                                        "origin_pos_y": df_selected[y_columns].median().to_numpy()},
+                                       index=["Player{0}".format(col.split("_")[-2]) for col in x_columns])
+        return player_position
 
-        df_pos_x = pd.melt(df_tracking, id_vars=[], value_vars=x_columns)
-        df_pos_x["player"] = df_pos_x.variable.apply(lambda x: x[:-2])
-        df_pos_x = df_pos_x.groupby("player").agg({"value": "median"})
-        df_pos_x = df_pos_x.rename(columns={"value": "origin_pos_x"})
+    def _report_frame_step_error(self, df_passes, field_dimen=(106., 68.)):
+        """
+        Compare the positions computed from the decimated tracking data with those computed from every frame,
+        printing the distance in meters between both for the players who made passes.
+        """
+        df_tracking, tracking_transform = self._full_tracking(self.team_name)
+        full_position = self._average_positions(df_tracking, tracking_transform, df_passes)
+
+        players = self.player_pass_count.index
+        error = np.hypot((self.player_position.loc[players, "origin_pos_x"] - full_position.loc[players, "origin_pos_x"]) * field_dimen[0],
+                         (self.player_position.loc[players, "origin_pos_y"] - full_position.loc[players, "origin_pos_y"]) * field_dimen[1])
+        print("Positions from every {0} frames differ from full resolution by {1:.2f}m on average ({2:.2f}m at most, {3})".format(
+            self.frame_step, error.mean(), error.max(), error.idxmax()))
+
+
+class MetricaPassTimePassingNetwork(MetricaTrackingPassingNetwork):
+    def __init__(self, args):
+        super(MetricaPassTimePassingNetwork, self).__init__(args)
+        self.pass_metrics = getattr(args, "pass_metrics", False)
+        self.df_tracking_opponent = None
+        self.player_pressure = None
+        self.pair_lane_opponents = None
+
+    def prepare_data(self):
+        """
+        Prepares the five pandas DataFrames that 'draw_pass_map' needs.
+
+        Instead of the event coordinates or the average location over all frames, players are located where the
+        tracking data places them when passes happen: the passer at the pass's 'Start Frame' and the receiver at
+        its 'End Frame'. Every pass is kept in 'df_passes' with its origin and destination coordinates and,
+        if requested, the pressure on the passer and the opponents in the passing lane (see 'pass_pressure_metrics').
+        """
+        df_passes = self._select_passes()
+
+        # In this type of plot, both the size and color (i.e. value) mean the same: number of passes
+        self.player_pass_value = df_passes.groupby("From").size().to_frame("pass_value")
+        self.player_pass_count = df_passes.groupby("From").size().to_frame("num_passes")
 
-        df_pos_y = pd.melt(df_tracking, id_vars=[], value_vars=y_columns)
-        df_pos_y["player"] = df_pos_y.variable.apply(lambda x: x[:-2])
-        df_pos_y = df_pos_y.groupby("player").agg({"value": "median"})
-        df_pos_y = df_pos_y.rename(columns={"value": "origin_pos_y"})
+        # 'pair_key' combines the names of the passer and receiver of each pass (sorted alphabetically)
+        df_passes["pair_key"] = df_passes.apply(lambda x: "_".join(sorted([x["From"], x["To"]])), axis=1)
+        self.pair_pass_value = df_passes.groupby("pair_key").size().to_frame("pass_value")
+        self.pair_pass_count = df_passes.groupby("pair_key").size().to_frame("num_passes")
 
-        player_position = df_pos_x.merge(df_pos_y, left_index=True, right_index=True)
-        player_position.index = player_position.index.map(lambda x: "Player{0}".format(x.split("_")[-1]))
-        self.player_position = player_position
\ No newline at end of file
+        # Passer and receiver coordinates for all passes at once
+        self.tracking_transform.apply()
+        origins = player_positions_at(self.df_tracking, self.team_name, df_passes["From"], df_passes["Start Frame"])
+        destinations = player_positions_at(self.df_tracking, self.team_name, df_passes["To"], df_passes["End Frame"])
+        df_passes["origin_pos_x"], df_passes["origin_pos_y"] = origins[:, 0], origins[:, 1]
+        df_passes["destination_pos_x"], df_passes["destination_pos_y"] = destinations[:, 0], destinations[:, 1]
+
+        if self.pass_metrics:
+            df_passes = self._attach_pass_metrics(df_passes)
+
+        self.df_passes = df_passes
+
+        # Each player is placed at the median of the locations where he passed or received the ball
+        df_locations = pd.DataFrame({"player": np.concatenate([df_passes["From"], df_passes["To"]]),
+                                     "origin_pos_x": np.concatenate([origins[:, 0], destinations[:, 0]]),
+                                     "origin_pos_y": np.concatenate([origins[:, 1], destinations[:, 1]])})
+        self.player_position = df_locations.groupby("player").agg({"origin_pos_x": "median", "origin_pos_y": "median"})
+
+    def _attach_pass_metrics(self, df_passes):
+        """
+        Attach pressure and passing lane metrics to each pass, reading the opponent's tracking data (once) for it,
+        and aggregate them per passer (median distance to the nearest opponent) and per pair (mean number of
+        opponents in the lane), exporting both into CSV files next to the plot.
+        """
+        opponent = "Away" if self.team_name == "Home" else "Home"
+        df_tracking_opponent, opponent_transform = self._team_tracking(opponent)
+        self.df_tracking_opponent = opponent_transform.apply()
+
+        # Only the opponent's positions at the pass frames are needed, so both teams' tables are not merged
+        df_passes = pass_pressure_metrics(df_passes, self.df_tracking_opponent, opponent)
+        self.player_pressure = df_passes.groupby("From").agg(passer_pressure=("passer_pressure", "median"))
+        self.pair_lane_opponents = df_passes.groupby("pair_key").agg(lane_opponents=("lane_opponents", "mean"))
+
+        self.save_table(self.player_pressure, "players_pass_metrics")
+        self.save_table(self.pair_lane_opponents, "pairs_pass_metrics")
+        return df_passes
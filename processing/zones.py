@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 19 2020
+
+@author: Sergio Llana (@SergioMinuto90)
+"""
+
+
+import pandas as pd
+import numpy as np
+
+
+# Default grid: 6 zones along the length of the pitch and 4 across it
+DEFAULT_SHAPE = (6, 4)
+
+# Rows are named with a letter, so there can be one per letter of the alphabet at most
+MAX_ROWS = 26
+
+
+def zone_index(points, shape):
+    '''
+    Zone of each point (n, 2) in 0-1 range, on a grid of shape (columns along the length of the pitch, rows along its
+    width). Zones are numbered column by column, and points on (or beyond) the lines fall into the closest zone.
+    '''
+    cells = np.clip(np.floor(points * np.asarray(shape)).astype(int), 0, np.asarray(shape) - 1)
+    return np.ravel_multi_index((cells[:, 0], cells[:, 1]), shape)
+
+
+def zone_flows(origins, destinations, shape):
+    '''
+    Dense (zones, zones) matrix with the number of passes from each zone (rows) to each zone (columns).
+    Passes with an unknown origin or destination are left out.
+    '''
+    known = ~(np.isnan(origins).any(axis=1) | np.isnan(destinations).any(axis=1))
+    num_zones = shape[0] * shape[1]
+
+    flows = zone_index(origins[known], shape) * num_zones + zone_index(destinations[known], shape)
+    return np.bincount(flows, minlength=num_zones * num_zones).reshape(num_zones, num_zones)
+
+
+def zone_names(shape):
+    '''
+    Name of each zone: a letter for its row across the pitch and a number for its column along the pitch (e.g. 'B3').
+    Names have no underscores, as they are combined into the 'pair_key' of edges.
+    '''
+    if shape[1] > MAX_ROWS:
+        raise ValueError("Grids of zones can have {0} rows at most, not {1}".format(MAX_ROWS, shape[1]))
+
+    columns, rows = np.unravel_index(np.arange(shape[0] * shape[1]), shape)
+    return ["{0}{1}".format(chr(ord("A") + row), column + 1) for column, row in zip(columns, rows)]
+
+
+def zone_network(origins, destinations, shape):
+    '''
+    Passing network between the zones of a grid, in the five pandas DataFrames that 'draw_pass_map' needs:
+    zones are placed at their centers and sized by the passes made from them, and edges are the passes
+    between each pair of zones in either direction (passes within a zone are not drawn).
+
+    Returns
+    -----------
+        zone_position, zone_pass_count, zone_pass_value, pair_pass_count, pair_pass_value, flows
+    '''
+    names = np.array(zone_names(shape))
+    columns, rows = np.unravel_index(np.arange(len(names)), shape)
+    zone_position = pd.DataFrame({"origin_pos_x": (columns + 0.5) / shape[0], "origin_pos_y": (rows + 0.5) / shape[1]},
+                                 index=names)
+
+    flows = zone_flows(origins, destinations, shape)
+    passes_from = flows.sum(axis=1)
+    used = passes_from > 0
+    zone_pass_count = pd.DataFrame({"num_passes": passes_from[used]}, index=names[used])
+    zone_pass_value = pd.DataFrame({"pass_value": passes_from[used]}, index=names[used])
+
+    # Both directions of each pair of zones, as in the players' 'pair_key'
+    zone1, zone2 = np.triu_indices(len(names), k=1)
+    pair_passes = (flows + flows.T)[zone1, zone2]
+    used = pair_passes > 0
+    pair_keys = ["{0}_{1}".format(*sorted(pair)) for pair in zip(names[zone1[used]], names[zone2[used]])]
+    pair_pass_count = pd.DataFrame({"num_passes": pair_passes[used]}, index=pair_keys)
+    pair_pass_value = pd.DataFrame({"pass_value": pair_passes[used]}, index=pair_keys)
+
+    return zone_position, zone_pass_count, zone_pass_value, pair_pass_count, pair_pass_value, flows
@@ -7,8 +7,7 @@ Created on Sun Apr 19 2020
 """
 
 
-from processing.eventing import StatsBombBasicPassingNetwork, StatsBombValuePassingNetwork
-from processing.tracking import MetricaBasicPassingNetwork, MetricaTrackingPassingNetwork
+from processing import create_builder
 from utils import parse_args
 
 
@@ -17,19 +16,13 @@ def main(args):
     Instantiates a Passing Network Builder depending on the type of plot selected with the arguments
     in the command line.
     '''
-    if args.source == "eventing":
-        if args.plot_type == "pass_value":
-            plot_builder = StatsBombValuePassingNetwork(args)
-        else:
-            plot_builder = StatsBombBasicPassingNetwork(args)
-    else:
-        if args.plot_type == "tracking":
-            plot_builder = MetricaTrackingPassingNetwork(args)
-        else:
-            plot_builder = MetricaBasicPassingNetwork(args)
-
+    plot_builder = create_builder(args)
     plot_builder.build_and_save()
 
+    if getattr(args, "similarity_index", None):
+        from processing.similarity import update_index
+        update_index(args.similarity_index, plot_builder)
+
 
 if __name__ == "__main__":
     parsed_args = parse_args()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 19 2020
+
+@author: Sergio Llana (@SergioMinuto90)
+"""
+
+
+import argparse
+import sys
+
+from processing.pipeline import read_jobs, run_pipeline
+
+
+def main(args):
+    '''
+    Build every plot of the 'run.py' commands listed in a shell script (e.g. 'create_sample_plots.sh'),
+    reading data ahead while the previous plots are rendered and written.
+    '''
+    run_pipeline(read_jobs(args.jobs), prefetch=args.prefetch, processes=args.processes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('jobs', help='Shell script with one run.py command per plot')
+    parser.add_argument('--prefetch', dest='prefetch', help='Number of plots whose data is read ahead', type=int, default=2)
+    parser.add_argument('--processes', dest='processes', help='Number of worker processes (the number of CPUs by default)', type=int)
+    main(parser.parse_args(sys.argv[1:]))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 19 2020
+
+@author: Sergio Llana (@SergioMinuto90)
+"""
+
+
+import tempfile
+import unittest
+import json
+import os
+
+from utils import iter_json_array
+
+
+class IterJsonArrayTest(unittest.TestCase):
+    def _decode(self, text, chunk_size):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "array.json")
+            with open(path, "w") as f:
+                f.write(text)
+            return list(iter_json_array(path, chunk_size=chunk_size))
+
+    def test_items_split_between_chunks(self):
+        text = '[12345, 6, "a string", {"minute": 55, "tags": [1, 2]}, true, null, -0.25e3]'
+        for chunk_size in range(1, len(text) + 1):
+            self.assertEqual(self._decode(text, chunk_size), json.loads(text), "chunk_size={0}".format(chunk_size))
+
+    def test_empty_array(self):
+        self.assertEqual(self._decode(" [ ] ", 2), [])
+
+    def test_whitespace_longer_than_chunks(self):
+        text = " \n" * 10 + "[1, 2]" + "\t " * 10
+        for chunk_size in [1, 3, 7]:
+            self.assertEqual(self._decode(text, chunk_size), [1, 2], "chunk_size={0}".format(chunk_size))
+
+    def test_content_after_array(self):
+        for text in ["[1, 2] 3", "[1, 2]]", "[1, 2]" + " " * 10 + "[3]"]:
+            with self.assertRaises(ValueError, msg=text):
+                self._decode(text, 3)
+
+    def test_malformed_arrays(self):
+        for text in ["[1,,,2]", "[,1]", "[1,]", "[1 2]", "[1, 2"]:
+            with self.assertRaises(ValueError, msg=text):
+                self._decode(text, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,38 +9,114 @@ Created on Sun Apr 19 2020
 
 
 import pandas as pd
+import numpy as np
 import csv as csv
 import argparse
 import json
 import sys
+import re
 
 
-def parse_args():
+def parse_args(argv=None):
     '''
-    Parse command line arguments for plot customization
+    Parse command line arguments for plot customization (those of the script if 'argv' is not given)
     '''
     parser = argparse.ArgumentParser()
     parser.add_argument('-m', '--match-id', dest='match_id', help='Match ID', required=True)
-    parser.add_argument('-t', '--team-name', dest='team_name', help='Selected team in match', required=True)
+    parser.add_argument('-t', '--team-name', dest='team_name', help='Selected team in match')
     parser.add_argument('-s', '--source', dest='source', help='Data source', choices=["eventing", "tracking"], required=True)
-    parser.add_argument('-k', '--plot-type', dest='plot_type', help='Type of plot', choices=["basic", "pass_value", "tracking"], required=True)
+    parser.add_argument('-k', '--plot-type', dest='plot_type', help='Type of plot', choices=["basic", "pass_value", "tracking", "pass_time", "zones"], required=True)
     parser.add_argument('-b', '--ball-location', dest='half', help='Filter on the location of the ball', choices=["own_half", "opponent_half"])
     parser.add_argument('-c', '--context', dest='context', help='Whether the team is attacking or defending', choices=["attacking", "defending"])
-    args = parser.parse_args(sys.argv[1:])
+    parser.add_argument('--pass-metrics', dest='pass_metrics', help='Compute pressure on the passer and opponents in the passing lane', action='store_true')
+    parser.add_argument('--frame-step', dest='frame_step', help='Only use one every FRAME_STEP tracking frames', type=_positive_int)
+    parser.add_argument('--frame-step-report', dest='frame_step_report', help='Report the position error caused by --frame-step', action='store_true')
+    parser.add_argument('--zones', dest='zones', help='Grid of zones for the zones plot type, as COLUMNSxROWS (6x4 by default)', type=_grid_shape)
+    parser.add_argument('--both-teams', dest='both_teams', help='Build the networks of both teams side by side, reading the match once', action='store_true')
+    parser.add_argument('--bootstrap', dest='bootstrap', help='Export confidence intervals of the network weights from BOOTSTRAP resamples of its passes', type=_positive_int)
+    parser.add_argument('--bootstrap-alpha', dest='bootstrap_alpha', help='Draw edges more transparent the less certain their number of passes is', action='store_true')
+    parser.add_argument('--segments', dest='segments', help='Build a network for each segment of the match with a stable lineup', action='store_true')
+    parser.add_argument('--style', dest='style', help='Plot configuration file (visualization/plot_config.json by default)')
+    parser.add_argument('--no-render', dest='no_render', help='Compute the passing network without plotting it', action='store_true')
+    parser.add_argument('--similarity-index', dest='similarity_index', help='Add the passing network to this similarity index (.npz file)')
+    parser.add_argument('--no-cache', dest='no_cache', help='Build the plot even if its inputs have not changed since it was last built', action='store_true')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
 
-    if args.source == "eventing" and args.plot_type == "tracking":
-        print("ERROR: Cannot plot players based on true average position with eventing data")
+    if not args.team_name and not args.both_teams:
+        print("ERROR: Select a team with -t or build both teams' networks with --both-teams")
+        return None
+    elif args.both_teams and args.segments:
+        print("ERROR: Lineup segments can only be plotted for a single team")
+        return None
+    elif args.source == "eventing" and args.plot_type in ["tracking", "pass_time"]:
+        print("ERROR: Cannot plot players based on tracking positions with eventing data")
         return None
     elif args.source == "eventing" and (getattr(args, "context", None) or getattr(args, "half", None)):
         print("ERROR: Cannot filter player location in plot based on context or ball position")
         return None
+    elif (args.context or args.half) and args.plot_type != "tracking":
+        print("ERROR: Context and ball position filters are only applied to players' average positions ('tracking' plot type)")
+        return None
     elif args.source == "tracking" and args.plot_type == "pass_value":
         print("ERROR: Cannot compute pass value on tracking data")
         return None
+    elif (args.frame_step or args.frame_step_report) and args.plot_type != "tracking":
+        print("ERROR: Decimated tracking data is only used for players' average positions ('tracking' plot type)")
+        return None
+    elif args.zones and args.plot_type != "zones":
+        print("ERROR: A grid of zones can only be set for the 'zones' plot type")
+        return None
+    elif args.similarity_index and args.plot_type == "zones":
+        print("ERROR: Only networks of players can be added to a similarity index")
+        return None
+    elif args.bootstrap and (args.segments or args.both_teams or args.plot_type == "zones"):
+        print("ERROR: Confidence intervals can only be computed for a single network of players")
+        return None
+    elif args.bootstrap_alpha and not args.bootstrap:
+        print("ERROR: Edge transparency needs confidence intervals (--bootstrap)")
+        return None
+    elif args.pass_metrics and args.plot_type != "pass_time":
+        print("ERROR: Pass metrics need players' positions at pass time ('pass_time' plot type)")
+        return None
+    elif args.pass_metrics and args.segments:
+        print("ERROR: Pass metrics can only be exported for the whole network, not for lineup segments")
+        return None
 
     return args
 
 
+def _positive_int(value):
+    '''
+    Parse a whole number greater than zero, such as a number of samples.
+    '''
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+
+    if number < 1:
+        raise argparse.ArgumentTypeError("invalid value '{0}', expected a positive integer".format(value))
+    return number
+
+
+def _grid_shape(value):
+    '''
+    Parse a grid shape such as '6x4' into a (columns, rows) tuple.
+    '''
+    try:
+        shape = tuple(int(n) for n in value.lower().split("x"))
+    except ValueError:
+        shape = ()
+
+    from processing.zones import MAX_ROWS
+
+    if len(shape) != 2 or min(shape) < 1:
+        raise argparse.ArgumentTypeError("invalid grid '{0}', expected COLUMNSxROWS (e.g. 6x4)".format(value))
+    if shape[1] > MAX_ROWS:
+        raise argparse.ArgumentTypeError("invalid grid '{0}', it can have {1} rows at most".format(value, MAX_ROWS))
+    return shape
+
+
 def read_json(path):
     '''
     Read JSON file from path
@@ -56,18 +132,237 @@ def read(path):
         return f.read()
 
 
+_json_whitespace = re.compile(r'\s*')
+_json_number_tail = re.compile(r'[\d.eE+-]*')
+
+
+def _skip_json_whitespace(f, buffer, chunk_size):
+    '''
+    Rest of a buffer from its first character that is not whitespace, reading more chunks of the file while it is
+    all whitespace. Empty at the end of the file.
+    '''
+    buffer = buffer.lstrip()
+    while not buffer:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return ""
+        buffer = chunk.lstrip()
+    return buffer
+
+
+def iter_json_array(path, chunk_size=1 << 16):
+    '''
+    Incrementally decode the items of a top-level JSON array, reading the file in chunks so that
+    neither the whole document nor the whole list of decoded items is held in memory.
+    '''
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        # Leading whitespace can be longer than a chunk
+        buffer = _skip_json_whitespace(f, "", chunk_size)
+        if not buffer.startswith('['):
+            raise ValueError("{0} does not contain a JSON array".format(path))
+
+        # What was last read: the opening bracket, an item or the comma after it
+        pos, eof, last = 1, False, "["
+        while True:
+            pos = _json_whitespace.match(buffer, pos).end()
+            if pos < len(buffer):
+                char = buffer[pos]
+                # Items are separated by exactly one comma, and the array cannot end with one
+                if char == ']' and last != ",":
+                    # Nothing but whitespace can follow the array
+                    if _skip_json_whitespace(f, buffer[pos + 1:], chunk_size):
+                        raise ValueError("Malformed JSON array in {0}: unexpected content after ']'".format(path))
+                    return
+                elif char == ',' and last == "item":
+                    pos, last = pos + 1, ","
+                    continue
+                elif char in "]," or last == "item":
+                    raise ValueError("Malformed JSON array in {0}: unexpected '{1}'".format(path, char))
+
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    # The next item is split between chunks: keep the unread tail and read more
+                    if eof:
+                        raise
+                else:
+                    # A number cut by the end of the buffer (e.g. '123' of '12345' or '-0' of '-0.25') goes on in the next chunk
+                    if eof or not _json_number_tail.fullmatch(buffer, end):
+                        yield item
+                        pos, last = end, "item"
+                        continue
+            elif eof:
+                raise ValueError("Malformed JSON array in {0}: missing ']'".format(path))
+
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+
+
+# Fields extracted from each StatsBomb event, as (column name, path in the nested JSON event)
+STATSBOMB_EVENT_FIELDS = [
+    ("type_name", ("type", "name")),
+    ("team_name", ("team", "name")),
+    ("player_name", ("player", "name")),
+    ("pass_recipient_name", ("pass", "recipient", "name")),
+    ("pass_outcome_name", ("pass", "outcome", "name")),
+    ("foul_committed_card_name", ("foul_committed", "card", "name")),
+    ("substitution_replacement_name", ("substitution", "replacement", "name")),
+    ("timestamp", ("timestamp",)),
+]
+
+# Fields stored as pandas categoricals: a few dozen distinct names repeated over thousands of events,
+# kept as integer codes so that filtering them compares integers instead of strings
+STATSBOMB_CATEGORICAL_FIELDS = ["type_name", "team_name", "player_name", "pass_recipient_name", "pass_outcome_name",
+                                "foul_committed_card_name", "substitution_replacement_name"]
+
+
+def _json_path(item, path):
+    '''
+    Get a nested value from a decoded JSON object, or None if any key in the path is missing.
+    '''
+    for key in path:
+        item = item.get(key)
+        if item is None:
+            return None
+    return item
+
+
+def read_statsbomb_events(path, capacity=4096):
+    '''
+    Stream a StatsBomb events file keeping only passes, substitutions and cards, and only the fields
+    the passing networks need. Values are written straight into preallocated typed arrays (grown
+    geometrically when full) instead of flattening every event with json_normalize.
+    'Starting XI' events are unrolled into one row per starting player.
+
+    Names are encoded as they are read into the integer codes of categorical columns (see
+    STATSBOMB_CATEGORICAL_FIELDS), minutes are int16 and locations float32.
+
+    Returns
+    -----------
+        df_events: pandas DataFrame with the columns in STATSBOMB_EVENT_FIELDS plus 'minute',
+                   'location_x', 'location_y' and the end location of passes ('pass_end_x', 'pass_end_y').
+        max_minute: last minute of the match, taking all events into account.
+    '''
+    columns = {name: np.empty(capacity, dtype=np.int16 if name in STATSBOMB_CATEGORICAL_FIELDS else object)
+               for name, _ in STATSBOMB_EVENT_FIELDS}
+    columns["minute"] = np.empty(capacity, dtype=np.int16)
+    columns["location_x"] = np.empty(capacity, dtype=np.float32)
+    columns["location_y"] = np.empty(capacity, dtype=np.float32)
+    columns["pass_end_x"] = np.empty(capacity, dtype=np.float32)
+    columns["pass_end_y"] = np.empty(capacity, dtype=np.float32)
+
+    # Code of each name already seen in every categorical column (missing values are -1)
+    categories = {name: {None: -1} for name in STATSBOMB_CATEGORICAL_FIELDS}
+
+    num_events, max_minute = 0, 0
+    for event in iter_json_array(path):
+        minute = event["minute"]
+        max_minute = max(max_minute, minute)
+
+        type_name = event["type"]["name"]
+        if type_name == "Starting XI":
+            rows = [dict(event, player=starter["player"]) for starter in event["tactics"]["lineup"]]
+        elif type_name in ("Pass", "Substitution") or _json_path(event, ("foul_committed", "card")) is not None:
+            rows = [event]
+        else:
+            continue
+
+        for row in rows:
+            if num_events == capacity:
+                columns = {name: np.concatenate([values, np.empty_like(values)]) for name, values in columns.items()}
+                capacity *= 2
+
+            for name, field_path in STATSBOMB_EVENT_FIELDS:
+                value = _json_path(row, field_path)
+                if name in categories:
+                    value = categories[name].setdefault(value, len(categories[name]) - 1)
+                columns[name][num_events] = value
+
+            location = row.get("location") or (np.nan, np.nan)
+            end_location = _json_path(row, ("pass", "end_location")) or (np.nan, np.nan)
+            columns["minute"][num_events] = minute
+            columns["location_x"][num_events] = location[0]
+            columns["location_y"][num_events] = location[1]
+            columns["pass_end_x"][num_events] = end_location[0]
+            columns["pass_end_y"][num_events] = end_location[1]
+            num_events += 1
+
+    df_events = pd.DataFrame({name: values[:num_events] for name, values in columns.items()})
+    for name, codes in categories.items():
+        df_events[name] = pd.Categorical.from_codes(df_events[name], [value for value in codes if value is not None])
+
+    return df_events, max_minute
+
+
 def to_single_playing_direction(home, away, events):
     '''
     Flip coordinates in second half so that each team always shoots in the same direction through the match.
     '''
     for team in [home, away, events]:
-        second_half_idx = team.Period.idxmax(2)
-        columns = [c for c in team.columns if c[-1].lower() in ['x', 'y']]
-        team.loc[second_half_idx:, columns] = team.loc[second_half_idx:, columns].apply(lambda x: 1-x, axis=1)
+        CoordinateTransform(team).apply()
 
     return home, away, events
 
 
+def coordinate_columns(data):
+    '''
+    Names of the coordinate columns of a Metrica DataFrame (those ending in 'x' or 'y').
+    '''
+    return [c for c in data.columns if c[-1].lower() in ['x', 'y']]
+
+
+def second_half_start(data):
+    '''
+    Row position of the first frame (or event) of the second period, or the number of rows if there is none.
+    Rows are expected to be sorted by period, as they are in Metrica files.
+    '''
+    return int(np.searchsorted(data.Period.to_numpy(), 2))
+
+
+class CoordinateTransform(object):
+    '''
+    Vectorized, in-place coordinate transform of a Metrica DataFrame: second half flipped to a single playing
+    direction ('1 - x' on the rows of the second period) and, optionally, affine scaling to meters.
+
+    Each column is transformed at most once, so the stage can be applied lazily with only the columns
+    a builder is about to read. Columns that were already transformed elsewhere can be given in 'transformed'.
+    '''
+    def __init__(self, data, single_direction=True, field_dimen=None, transformed=()):
+        self.data = data
+        self.single_direction = single_direction
+        self.field_dimen = field_dimen
+        self.transformed = set(transformed)
+
+    def apply(self, columns=None):
+        '''
+        Transform the given coordinate columns (all of them by default) that were not transformed yet.
+        '''
+        columns = coordinate_columns(self.data) if columns is None else columns
+        pending = [c for c in columns if c not in self.transformed]
+        if not pending:
+            return self.data
+
+        # All pending columns are transformed as a single 2-D float array
+        values = self.data[pending].to_numpy()
+        if values.dtype.kind != 'f':
+            values = values.astype(float)
+
+        if self.single_direction:
+            second_half = values[second_half_start(self.data):]
+            np.subtract(1, second_half, out=second_half)
+
+        if self.field_dimen is not None:
+            is_x = np.array([c[-1].lower() == 'x' for c in pending])
+            values[:, is_x] = (values[:, is_x] - 0.5) * self.field_dimen[0]
+            values[:, ~is_x] = -1 * (values[:, ~is_x] - 0.5) * self.field_dimen[1]
+
+        self.data[pending] = values
+        self.transformed.update(pending)
+        return self.data
+
+
 """
 ----------------------
 Laurie's methods below
@@ -96,28 +391,121 @@ def read_event_data(DATADIR, game_id):
     return events
 
 
-def tracking_data(DATADIR, game_id, teamname):
+def tracking_data(DATADIR, game_id, teamname, players=None, ball=True, frames=None, step=None, dtype=None):
     '''
     tracking_data(DATADIR,game_id,teamname):
     read Metrica tracking data for game_id and return as a DataFrame.
     teamname is the name of the team in the filename. For the sample data this is either 'Home' or 'Away'.
+
+    The optional arguments project the data so that only what is needed is parsed:
+    players: jersey numbers (as strings) of the players whose columns are read. All of them by default.
+    ball: whether to read the ball columns.
+    frames: (first, last) range of frames to keep, both included.
+    step: only read one every 'step' frames (decimated tracking data).
+    dtype: dtype of the coordinate columns (e.g. np.float32).
+    '''
+    teamfile, columns = _tracking_header(DATADIR, game_id, teamname)
+    usecols = [c for c in columns if _keep_tracking_column(c, teamname, players, ball)]
+    dtypes = {c: dtype for c in usecols if c[-1] in ['x', 'y']} if dtype else None
+    step = step or 1
+    skiprows = 3 if step == 1 else (lambda i: i < 3 or (i - 3) % step != 0)
+    nrows = -(-frames[1] // step) if frames else None  # frames are numbered from 1, one per row
+    # Second: read in tracking data and place into pandas Dataframe
+    tracking = pd.read_csv(teamfile, names=columns, usecols=usecols, dtype=dtypes, index_col='Frame', skiprows=skiprows, nrows=nrows)
+    if frames:
+        tracking = tracking.loc[frames[0]:frames[1]]
+    return tracking
+
+
+def _tracking_header(DATADIR, game_id, teamname):
     '''
-    teamfile = 'Sample_Game_%s/Sample_Game_%s_RawTrackingData_%s_Team.csv' % (game_id, game_id, teamname)
+    Path of a Metrica tracking file and the column names built from its three header rows.
+    '''
+    teamfile = '{}/Sample_Game_{}/Sample_Game_{}_RawTrackingData_{}_Team.csv'.format(DATADIR, game_id, game_id, teamname)
     # First:  deal with file headers so that we can get the player names correct
-    csvfile = open('{}/{}'.format(DATADIR, teamfile), 'r')  # create a csv file reader
-    reader = csv.reader(csvfile)
-    teamnamefull = next(reader)[3].lower()
-    # construct column names
-    jerseys = [x for x in next(reader) if x != '']  # extract player jersey numbers from second row
-    columns = next(reader)
+    with open(teamfile, 'r') as csvfile:  # create a csv file reader
+        reader = csv.reader(csvfile)
+        teamnamefull = next(reader)[3].lower()
+        # construct column names
+        jerseys = [x for x in next(reader) if x != '']  # extract player jersey numbers from second row
+        columns = next(reader)
     for i, j in enumerate(jerseys):  # create x & y position column headers for each player
         columns[i * 2 + 3] = "{}_{}_x".format(teamname, j)
         columns[i * 2 + 4] = "{}_{}_y".format(teamname, j)
     columns[-2] = "ball_x"  # column headers for the x & y positions of the ball
     columns[-1] = "ball_y"
-    # Second: read in tracking data and place into pandas Dataframe
-    tracking = pd.read_csv('{}/{}'.format(DATADIR, teamfile), names=columns, index_col='Frame', skiprows=3)
-    return tracking
+    return teamfile, columns
+
+
+def _keep_tracking_column(column, teamname, players, ball):
+    '''
+    Whether a tracking column belongs to the projection chosen in 'tracking_data'.
+    '''
+    if column.startswith("ball_"):
+        return ball
+    if column.startswith(teamname + "_"):
+        return players is None or column.split("_")[1] in players
+    return True
+
+
+def player_appearances(DATADIR, game_id, teamname):
+    '''
+    First and last time (in seconds) each player of a team has a position in Metrica tracking data, indexed by
+    player column prefix (e.g. 'Home_12'). Only the time and the players' x columns are parsed.
+    '''
+    teamfile, columns = _tracking_header(DATADIR, game_id, teamname)
+    x_columns = [c for c in columns if c.startswith(teamname + "_") and c.endswith("_x")]
+    tracking = pd.read_csv(teamfile, names=columns, usecols=['Time [s]'] + x_columns, skiprows=3,
+                           dtype={c: np.float32 for c in x_columns})
+    return tracking_appearances(tracking, x_columns)
+
+
+def kick_off_x(DATADIR, game_id, teamname, num_frames=25):
+    '''
+    Mean x coordinate (0-1 range) of a team's players in the first frames of Metrica tracking data, when they line up
+    in their own half for the kick off. Only those frames and the players' x columns are parsed.
+    '''
+    teamfile, columns = _tracking_header(DATADIR, game_id, teamname)
+    x_columns = [c for c in columns if c.startswith(teamname + "_") and c.endswith("_x")]
+    tracking = pd.read_csv(teamfile, names=columns, usecols=x_columns, skiprows=3, nrows=num_frames,
+                           dtype={c: np.float32 for c in x_columns})
+    return np.nanmean(tracking.to_numpy())
+
+
+def tracking_appearances(tracking, x_columns):
+    '''
+    First and last time (in seconds) each of the given x columns of a tracking DataFrame is not NaN,
+    indexed by the column prefix. Players that never appear get NaN.
+    '''
+    on_pitch = tracking[x_columns].notna().to_numpy()
+    time = tracking['Time [s]'].to_numpy()
+    appears = on_pitch.any(axis=0)
+
+    first_times = time[on_pitch.argmax(axis=0)]
+    last_times = time[len(time) - 1 - on_pitch[::-1].argmax(axis=0)]
+    return pd.DataFrame({"first_time": np.where(appears, first_times, np.nan),
+                         "last_time": np.where(appears, last_times, np.nan)},
+                        index=[c[:-2] for c in x_columns])
+
+
+def player_positions_at(tracking, teamname, players, frames):
+    '''
+    Coordinates of several (player, frame) pairs, gathered from a tracking DataFrame with a single fancy-indexing call.
+    players are Metrica player ids (e.g. 'Player10') and frames are frame numbers, both array-like of the same length.
+    Returns an (n, 2) array of x, y coordinates, with NaN where the player or frame is not in the tracking data.
+    '''
+    x_columns = [c for c in tracking.columns if c.startswith(teamname + "_") and c.endswith("_x")]
+    y_columns = [c[:-1] + "y" for c in x_columns]
+    player_ids = pd.Index(["Player{0}".format(c.split("_")[1]) for c in x_columns])
+
+    rows = tracking.index.get_indexer(np.asarray(frames))
+    cols = player_ids.get_indexer(np.asarray(players))
+    found = (rows >= 0) & (cols >= 0)
+
+    positions = np.full((len(rows), 2), np.nan)
+    positions[found, 0] = tracking[x_columns].to_numpy()[rows[found], cols[found]]
+    positions[found, 1] = tracking[y_columns].to_numpy()[rows[found], cols[found]]
+    return positions
 
 
 def merge_tracking_data(home, away):
@@ -131,14 +519,11 @@ def to_metric_coordinates(data, field_dimen=(106., 68.)):
     '''
     Convert positions from Metrica units to meters (with origin at centre circle)
     '''
-    x_columns = [c for c in data.columns if c[-1].lower() == 'x']
-    y_columns = [c for c in data.columns if c[-1].lower() == 'y']
-    data[x_columns] = (data[x_columns] - 0.5) * field_dimen[0]
-    data[y_columns] = -1 * (data[y_columns] - 0.5) * field_dimen[1]
+    CoordinateTransform(data, single_direction=False, field_dimen=field_dimen).apply()
     ''' 
     ------------ ***NOTE*** ------------
     Metrica actually define the origin at the *top*-left of the field, not the bottom-left, as discussed in the YouTube video. 
-    I've changed the line above to reflect this. It was originally:
+    I've changed the y transform to reflect this. It was originally:
     data[y_columns] = ( data[y_columns]-0.5 ) * field_dimen[1]
     ------------ ********** ------------
     '''
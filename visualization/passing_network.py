@@ -7,44 +7,30 @@ Created on Sun Apr 19 2020
 """
 
 
-from matplotlib.colors import Normalize
 import matplotlib.patches as patches
 import matplotlib.patheffects as pe
 import matplotlib.pyplot as plt
-from matplotlib import cm
 import pandas as pd
 import numpy as np
 
-from utils import read_json
+from visualization.style import load_style
 
 
-config = read_json("visualization/plot_config.json")
-height = float(config["height"])
-width = float(config["width"])
-
-
-def _point_to_meters(p):
+def _point_to_meters(p, style):
     '''
     Convert a point's coordinates from a 0-1 range to meters.
     '''
-    return np.array([p[0]*width, p[1]*height])
+    return np.array([p[0]*style.width, p[1]*style.height])
 
 
-def _meters_to_point(p):
+def _meters_to_point(p, style):
     '''
     Convert a point's coordinates from meters to a 0-1 range.
     '''
-    return np.array([p[0]/width, p[1]/height])
+    return np.array([p[0]/style.width, p[1]/style.height])
 
 
-def _change_range(value, old_range, new_range):
-    '''
-    Convert a value from one range to another one, maintaining ratio.
-    '''
-    return ((value-old_range[0]) / (old_range[1]-old_range[0])) * (new_range[1]-new_range[0]) + new_range[0]
-
-
-def draw_pitch(min_x=0, max_x=1):
+def draw_pitch(min_x=0, max_x=1, ax=None, zones=None, style=None):
     """
     Plot an empty horizontal football pitch, returning Matplotlib's ax object so we can keep adding elements to it.
 
@@ -52,18 +38,24 @@ def draw_pitch(min_x=0, max_x=1):
     -----------
         min_x: float value from 0 to 'max_x' to choose a subsection of the pitch. Default value is 0.
         max_x: float value from 'min_x' to 1 to choose a subsection of the pitch. Default value is 1.
+        ax: Matplotlib's axis object to plot the pitch on. If not specified, a new figure is created.
+        zones: (columns, rows) of a grid of zones to plot on the pitch (see 'processing.zones'). If not specified, no grid.
+        style: PlotStyle with the colors and sizes of the plot. If not specified, the one in 'plot_config.json'.
 
     Returns
     -----------
        ax : Matplotlib's axis object to keetp adding elements on the pitch.
     """
-    background_color = config["background_color"]
-    lines_color = config["lines_color"]
-    fig_size = config["fig_size"]
+    style = style or load_style()
+    background_color = style.background_color
+    lines_color = style.lines_color
+    fig_size = style.fig_size
+    width, height = style.width, style.height
 
     # This allows to plot a subsection of the pitch
     ratio = height / float((width * max_x)-(width * min_x))
-    f, ax = plt.subplots(1, 1, figsize=(fig_size, fig_size*ratio), dpi=100)
+    if ax is None:
+        f, ax = plt.subplots(1, 1, figsize=(fig_size, fig_size*ratio), dpi=100)
 
     ax.set_ylim([0, height])
     ax.set_xlim([width*min_x, width*max_x])
@@ -71,10 +63,10 @@ def draw_pitch(min_x=0, max_x=1):
 
     # Plot outer lines
     line_pts = [
-        [_point_to_meters([0, 0]), _point_to_meters([0, 1])],  # left line
-        [_point_to_meters([1, 0]), _point_to_meters([1, 1])],  # right line
-        [_point_to_meters([0, 1]), _point_to_meters([1, 1])],  # top line
-        [_point_to_meters([0, 0]), _point_to_meters([1, 0])],  # bottom line
+        [_point_to_meters([0, 0], style), _point_to_meters([0, 1], style)],  # left line
+        [_point_to_meters([1, 0], style), _point_to_meters([1, 1], style)],  # right line
+        [_point_to_meters([0, 1], style), _point_to_meters([1, 1], style)],  # top line
+        [_point_to_meters([0, 0], style), _point_to_meters([1, 0], style)],  # bottom line
     ]
 
     for line_pt in line_pts:
@@ -83,7 +75,7 @@ def draw_pitch(min_x=0, max_x=1):
 
     # Plot boxes
     line_pts = [
-        [_point_to_meters([0.5, 0]), _point_to_meters([0.5, 1])],  # center line
+        [_point_to_meters([0.5, 0], style), _point_to_meters([0.5, 1], style)],  # center line
 
         # left box
         [[0, 24.85], [0, 2.85]],
@@ -122,13 +114,51 @@ def draw_pitch(min_x=0, max_x=1):
     ax.add_patch(patches.Wedge((52.5, 34), 9.5, 0, 360, fill=True, edgecolor=lines_color,
                                facecolor=lines_color, zorder=4, width=0.02, alpha=0.8))
 
-    plt.axis('off')
+    # Plot grid of zones
+    if zones is not None:
+        for x in np.linspace(0, width, zones[0] + 1)[1:-1]:
+            ax.plot([x, x], [0, height], linestyle=':', alpha=0.8, lw=1, zorder=3, color=lines_color)
+        for y in np.linspace(0, height, zones[1] + 1)[1:-1]:
+            ax.plot([0, width], [y, y], linestyle=':', alpha=0.8, lw=1, zorder=3, color=lines_color)
+
+    ax.axis('off')
     return ax
 
 
+def draw_pitches(num_pitches, num_columns=2, zones=None, style=None):
+    """
+    Plot a grid of empty pitches in a single figure, to show several passing networks as small multiples.
+
+    Parameters
+    -----------
+        num_pitches: number of pitches to plot.
+        num_columns: number of pitches in each row of the grid.
+        zones: (columns, rows) of a grid of zones to plot on each pitch. If not specified, no grid.
+        style: PlotStyle with the colors and sizes of the plot. If not specified, the one in 'plot_config.json'.
+
+    Returns
+    -----------
+       axes : list of Matplotlib's axis objects, one for each pitch.
+    """
+    style = style or load_style()
+    fig_size = style.fig_size
+
+    num_columns = min(num_pitches, num_columns)
+    num_rows = int(np.ceil(num_pitches / float(num_columns)))
+    f, axes = plt.subplots(num_rows, num_columns, figsize=(fig_size, fig_size*(style.height/style.width)*num_rows/num_columns),
+                           dpi=100, squeeze=False)
+
+    axes = axes.flatten()
+    for ax in axes[num_pitches:]:
+        ax.axis('off')
+
+    return [draw_pitch(ax=ax, zones=zones, style=style) for ax in axes[:num_pitches]]
+
+
 def draw_pass_map(ax, player_position,
                   player_pass_count, player_pass_value, pair_pass_count, pair_pass_value, title="", legend="",
-                  max_player_count=None, max_player_value=None, max_pair_count=None, max_pair_value=None):
+                  max_player_count=None, max_player_value=None, max_pair_count=None, max_pair_value=None, pair_alpha=None,
+                  style=None):
     """
     Plot a passing network.
 
@@ -146,15 +176,21 @@ def draw_pass_map(ax, player_position,
         max_player_value: max pass value per player. If not specified, it uses the player_pass_value.pass_value.max()
         max_pair_count: max number of passes per player pair. If not specified, it uses the pair_pass_count.num_passes.max()
         max_pair_value: max pass value per player pair. If not specified, it uses the pair_pass_value.pass_value.max()
+        pair_alpha: pandas Series with 'player1_player2' as index and the transparency of each edge. If not specified,
+                    or for pairs not in it, edges are opaque.
+        style: PlotStyle with the colors and sizes of the plot. If not specified, the one in 'plot_config.json'.
 
     Returns
     -----------
        ax : Matplotlib's axis object to keep adding elements on the pitch.
     """
-    background_color = config["background_color"]
+    style = style or load_style()
+    background_color = style.background_color
+    width, height = style.width, style.height
 
-    player_position["origin_pos_y"] = player_position["origin_pos_y"]*height
-    player_position["origin_pos_x"] = player_position["origin_pos_x"]*width
+    # Positions in meters, leaving the caller's DataFrame in 0-1 range
+    player_position = player_position.assign(origin_pos_x=player_position["origin_pos_x"]*width,
+                                             origin_pos_y=player_position["origin_pos_y"]*height)
 
     # This allows to fix the range of sizes and color scales so that two plots from different teams are comparable.
     max_player_count = player_pass_count.num_passes.max() if max_player_count is None else max_player_count
@@ -163,10 +199,14 @@ def draw_pass_map(ax, player_position,
     max_pair_value = pair_pass_value.pass_value.max() if max_pair_value is None else max_pair_value
 
     # Step 1: plot edges
-    if config["plot_edges"]:
-        # Combine num_passes and pass_value columns into one DataFrame
+    if style.plot_edges:
+        # Combine num_passes and pass_value columns into one DataFrame, styling all edges at once
         pair_stats = pd.merge(pair_pass_count, pair_pass_value, left_index=True, right_index=True)
-        for pair_key, row in pair_stats.iterrows():
+        line_widths = style.edge_width(pair_stats.num_passes, max_pair_count)
+        edge_colors = style.edge_color(pair_stats.pass_value, max_pair_value)
+        edge_alphas = [1] * len(pair_stats) if pair_alpha is None else pair_alpha.reindex(pair_stats.index).fillna(1)
+
+        for pair_key, line_width, edge_color, edge_alpha in zip(pair_stats.index, line_widths, edge_colors, edge_alphas):
             player1, player2 = pair_key.split("_")
 
             player1_x = player_position.loc[player1]["origin_pos_x"]
@@ -175,47 +215,34 @@ def draw_pass_map(ax, player_position,
             player2_x = player_position.loc[player2]["origin_pos_x"]
             player2_y = player_position.loc[player2]["origin_pos_y"]
 
-            num_passes = row["num_passes"]
-            pass_value = row["pass_value"]
-
-            line_width = _change_range(num_passes, (0, max_pair_count), (config["min_edge_width"], config["max_edge_width"]))
-            norm = Normalize(vmin=0, vmax=max_pair_value)
-            edge_cmap = cm.get_cmap(config["nodes_cmap"])
-            edge_color = edge_cmap(norm(pass_value))
-
             ax.plot([player1_x, player2_x], [player1_y, player2_y],
-                    'w-', linestyle='-', alpha=1, lw=line_width, zorder=3, color=edge_color)
+                    'w-', linestyle='-', alpha=edge_alpha, lw=line_width, zorder=3, color=edge_color)
 
     # Step 2: plot nodes
-    # Combine num_passes and pass_value columns into one DataFrame
+    # Combine num_passes and pass_value columns into one DataFrame, styling all nodes at once
     player_stats = pd.merge(player_pass_count, player_pass_value, left_index=True, right_index=True)
-    for player_name, row in player_stats.iterrows():
+    marker_sizes = style.node_size(player_stats.num_passes, max_player_count)
+    node_colors = style.node_color(player_stats.pass_value, max_player_value)
+
+    for player_name, marker_size, node_color in zip(player_stats.index, marker_sizes, node_colors):
         player_x = player_position.loc[player_name]["origin_pos_x"]
         player_y = player_position.loc[player_name]["origin_pos_y"]
 
-        num_passes = row["num_passes"]
-        pass_value = row["pass_value"]
-
-        marker_size = _change_range(num_passes, (0, max_player_count), (config["min_node_size"], config["max_node_size"]))
-        norm = Normalize(vmin=0, vmax=max_player_value)
-        node_cmap = cm.get_cmap(config["nodes_cmap"])
-        node_color = node_cmap(norm(pass_value))
-
         ax.plot(player_x, player_y, '.', color=node_color, markersize=marker_size, zorder=5)
         ax.plot(player_x, player_y, '.', color=background_color, markersize=marker_size-20, zorder=6)
         ax.annotate(player_name, xy=(player_x, player_y), ha="center", va="center", zorder=7,
-                    fontsize=config["font_size"], color=config["font_color"], weight='bold',
+                    fontsize=style.font_size, color=style.font_color, weight='bold',
                     path_effects=[pe.withStroke(linewidth=2, foreground=background_color)])
 
     # Step 3: Extra information shown on the plot
     ax.annotate("@SergioMinuto90", xy=(0.99*width, 0.02*height),
-                ha="right", va="bottom", zorder=7, fontsize=10, color=config["lines_color"])
+                ha="right", va="bottom", zorder=7, fontsize=10, color=style.lines_color)
 
     if legend:
         ax.annotate(legend, xy=(0.01*width, 0.02*height),
-                    ha="left", va="bottom", zorder=7, fontsize=10, color=config["lines_color"])
+                    ha="left", va="bottom", zorder=7, fontsize=10, color=style.lines_color)
 
     if title:
         ax.set_title(title, loc="left")
 
-    return ax
\ No newline at end of file
+    return ax
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 19 2020
+
+@author: Sergio Llana (@SergioMinuto90)
+"""
+
+
+import numpy as np
+
+from utils import read_json
+
+
+DEFAULT_STYLE_PATH = "visualization/plot_config.json"
+
+# Styles already compiled in this process, by path of their configuration file
+_styles = {}
+
+
+def load_style(path=None):
+    '''
+    Compiled PlotStyle of a configuration file (the default 'plot_config.json' if not specified), shared by
+    every plot that uses it in this process.
+    '''
+    path = path or DEFAULT_STYLE_PATH
+    if path not in _styles:
+        _styles[path] = PlotStyle(read_json(path))
+    return _styles[path]
+
+
+class PlotStyle(object):
+    """
+    Configuration of the colors and sizes of a passing network plot (see 'plot_config.json'), compiled once so
+    that styling elements needs no configuration lookups nor colormap calls: colormaps are sampled into lookup
+    tables and sizes are linear scales applied to whole arrays.
+
+    Several styles can live in the same process (e.g. club theme, print and dark versions of a plot).
+    """
+    def __init__(self, config, lut_size=256):
+        # Matplotlib is only loaded when a style is compiled, so the default path can be imported without it
+        import matplotlib.pyplot as plt
+
+        self.config = config
+
+        self.background_color = config["background_color"]
+        self.lines_color = config["lines_color"]
+        self.font_color = config["font_color"]
+        self.plot_edges = config["plot_edges"]
+        self.fig_size = config["fig_size"]
+        self.font_size = config["font_size"]
+        self.width = float(config["width"])
+        self.height = float(config["height"])
+
+        self.node_sizes = (config["min_node_size"], config["max_node_size"])
+        self.edge_widths = (config["min_edge_width"], config["max_edge_width"])
+
+        # Passing networks have always been colored with the nodes' colormap, both for nodes and edges
+        # (the default configuration's "edges_cmap" is not used)
+        self.node_lut = plt.get_cmap(config["nodes_cmap"])(np.linspace(0, 1, lut_size))
+        self.edge_lut = self.node_lut
+
+    @staticmethod
+    def _scale(values, max_value, new_range):
+        '''
+        Convert values from a (0, max_value) range to 'new_range', maintaining ratio.
+        '''
+        return (np.asarray(values, dtype=float) / max_value) * (new_range[1]-new_range[0]) + new_range[0]
+
+    @staticmethod
+    def _colors(lut, values, max_value):
+        '''
+        RGBA colors of values normalized to a (0, max_value) range, looked up in a colormap table.
+        Values out of the range take the color of its closest end, and NaN values are transparent.
+        '''
+        values = np.asarray(values, dtype=float)
+        ratios = values / max_value if max_value > 0 else np.zeros_like(values)
+        rows = np.minimum((np.clip(np.nan_to_num(ratios), 0, 1) * len(lut)).astype(int), len(lut)-1)
+
+        colors = lut[rows]
+        colors[np.isnan(values)] = 0
+        return colors
+
+    def node_size(self, num_passes, max_num_passes):
+        return self._scale(num_passes, max_num_passes, self.node_sizes)
+
+    def node_color(self, pass_value, max_pass_value):
+        return self._colors(self.node_lut, pass_value, max_pass_value)
+
+    def edge_width(self, num_passes, max_num_passes):
+        return self._scale(num_passes, max_num_passes, self.edge_widths)
+
+    def edge_color(self, pass_value, max_pass_value):
+        return self._colors(self.edge_lut, pass_value, max_pass_value)